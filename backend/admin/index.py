@@ -1,54 +1,55 @@
 """Admin Panel - бан, мут, управление ролями пользователей"""
+import time
+_import_started = time.perf_counter()
+
+import io
+import csv
 import json
 import os
-import jwt
-import psycopg2
+import re
+import base64
 from datetime import datetime, timedelta
 
+from core import (
+    bump_cache_generation, decode_cursor, encode_cursor, get_conn, get_token, json_response,
+    jwt, mark_imported, parse_limit, preflight_response, psycopg2, release_conn, resolve_principal,
+    serve
+)
+
+
+USERS_PAGE_SIZE = 50
+LOGS_PAGE_SIZE = 100
+LOGS_PAGE_MAX = 500
+BULK_MAX_TARGETS = int(os.environ.get('BULK_MAX_TARGETS', '1000'))
+BULK_ACTIONS = ('ban', 'unban', 'mute', 'unmute')
+IMPORT_COLUMNS = ('username', 'rank', 'is_general')
+IMPORT_UNKNOWN_REPORT_MAX = 1000
+USERS_SEARCH_TIMEOUT_MS = int(os.environ.get('USERS_SEARCH_TIMEOUT_MS', '200'))
+
+
+PREFLIGHT_RESPONSE = preflight_response(
+    'GET, POST, PUT, DELETE, OPTIONS',
+    'Content-Type, X-Authorization'
+)
+
+
 def handler(event: dict, context) -> dict:
-    method = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Authorization',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
-    
-    auth_header = event.get('headers', {}).get('X-Authorization', '')
-    token = auth_header.replace('Bearer ', '')
+    return serve(event, 'admin', route, PREFLIGHT_RESPONSE)
+
+
+def route(event: dict) -> dict:
+    token = get_token(event)
     
     if not token:
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'No token provided'}),
-            'isBase64Encoded': False
-        }
+        return json_response(401, {'error': 'No token provided'})
     
     try:
-        payload = jwt.decode(token, os.environ.get('JWT_SECRET', 'default_secret'), algorithms=['HS256'])
-        if not payload.get('is_admin') and not payload.get('is_owner'):
-            return {
-                'statusCode': 403,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Admin access only'}),
-                'isBase64Encoded': False
-            }
-        admin_id = payload['user_id']
-    except:
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Invalid token'}),
-            'isBase64Encoded': False
-        }
+        principal = resolve_principal(token)
+        if not principal or (not principal['is_admin'] and not principal['is_owner']):
+            return json_response(403, {'error': 'Admin access only'})
+        admin_id = principal['id']
+    except (jwt.InvalidTokenError, KeyError):
+        return json_response(401, {'error': 'Invalid token'})
     
     path = event.get('params', {}).get('path', '')
     
@@ -60,21 +61,20 @@ def handler(event: dict, context) -> dict:
         return mute_user(event, admin_id)
     elif path == '/unmute':
         return unmute_user(event, admin_id)
+    elif path == '/bulk':
+        return bulk_moderate(event, admin_id)
     elif path == '/assign-role':
         return assign_faction_role(event, admin_id)
+    elif path == '/import-members':
+        return import_faction_members(event, admin_id)
     elif path == '/users':
         return get_users(event)
     elif path == '/logs':
-        return get_admin_logs()
+        return get_admin_logs(event)
     elif path == '/verify-code':
         return verify_admin_code(event)
     
-    return {
-        'statusCode': 404,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Not found'}),
-        'isBase64Encoded': False
-    }
+    return json_response(404, {'error': 'Not found'})
 
 
 def verify_admin_code(event: dict) -> dict:
@@ -83,35 +83,20 @@ def verify_admin_code(event: dict) -> dict:
         code = body.get('code')
         
         if not code:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'code required'}),
-                'isBase64Encoded': False
-            }
+            return json_response(400, {'error': 'code required'})
         
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_conn()
         cur = conn.cursor()
         
         cur.execute("SELECT id FROM admin_codes WHERE code = %s AND is_active = TRUE", (code,))
         valid = cur.fetchone()
         
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'valid': bool(valid)}),
-            'isBase64Encoded': False
-        }
+        release_conn(conn)
+        
+        return json_response(200, {'valid': bool(valid)})
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
 
 
 def ban_user(event: dict, admin_id: int) -> dict:
@@ -122,14 +107,9 @@ def ban_user(event: dict, admin_id: int) -> dict:
         duration = body.get('duration')
         
         if not username:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'username required'}),
-                'isBase64Encoded': False
-            }
+            return json_response(400, {'error': 'username required'})
         
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_conn()
         cur = conn.cursor()
         
         cur.execute("SELECT id FROM users WHERE username = %s", (username,))
@@ -137,44 +117,30 @@ def ban_user(event: dict, admin_id: int) -> dict:
         
         if not user:
             cur.close()
-            conn.close()
-            return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'User not found'}),
-                'isBase64Encoded': False
-            }
+            release_conn(conn)
+            return json_response(404, {'error': 'User not found'})
         
         user_id = user[0]
         expires_at = (datetime.utcnow() + timedelta(hours=duration)) if duration else None
         
         cur.execute("""
-            INSERT INTO bans (user_id, banned_by_id, reason, duration, banned_at, expires_at, is_active)
-            VALUES (%s, %s, %s, %s, %s, %s, TRUE)
-        """, (user_id, admin_id, reason, duration, datetime.utcnow(), expires_at))
+            INSERT INTO bans (user_id, banned_by_id, reason, duration, banned_at, expires_at, is_active, updated_at)
+            VALUES (%s, %s, %s, %s, %s, %s, TRUE, %s)
+        """, (user_id, admin_id, reason, duration, datetime.utcnow(), expires_at, datetime.utcnow()))
         
         cur.execute("""
             INSERT INTO admin_logs (admin_id, action_type, target_user_id, details, created_at)
             VALUES (%s, 'BAN', %s, %s, %s)
         """, (admin_id, user_id, f'Reason: {reason}', datetime.utcnow()))
         
+        bump_cache_generation(cur, ('principals',))
         conn.commit()
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 201,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'message': 'User banned'}),
-            'isBase64Encoded': False
-        }
+        release_conn(conn)
+        
+        return json_response(201, {'message': 'User banned'})
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
 
 
 def unban_user(event: dict, admin_id: int) -> dict:
@@ -183,14 +149,9 @@ def unban_user(event: dict, admin_id: int) -> dict:
         username = body.get('username')
         
         if not username:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'username required'}),
-                'isBase64Encoded': False
-            }
+            return json_response(400, {'error': 'username required'})
         
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_conn()
         cur = conn.cursor()
         
         cur.execute("SELECT id FROM users WHERE username = %s", (username,))
@@ -198,40 +159,29 @@ def unban_user(event: dict, admin_id: int) -> dict:
         
         if not user:
             cur.close()
-            conn.close()
-            return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'User not found'}),
-                'isBase64Encoded': False
-            }
+            release_conn(conn)
+            return json_response(404, {'error': 'User not found'})
         
         user_id = user[0]
         
-        cur.execute("UPDATE bans SET is_active = FALSE WHERE user_id = %s AND is_active = TRUE", (user_id,))
+        cur.execute(
+            "UPDATE bans SET is_active = FALSE, updated_at = %s WHERE user_id = %s AND is_active = TRUE",
+            (datetime.utcnow(), user_id)
+        )
         
         cur.execute("""
             INSERT INTO admin_logs (admin_id, action_type, target_user_id, details, created_at)
             VALUES (%s, 'UNBAN', %s, 'User unbanned', %s)
         """, (admin_id, user_id, datetime.utcnow()))
         
+        bump_cache_generation(cur, ('principals',))
         conn.commit()
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'message': 'User unbanned'}),
-            'isBase64Encoded': False
-        }
+        release_conn(conn)
+        
+        return json_response(200, {'message': 'User unbanned'})
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
 
 
 def mute_user(event: dict, admin_id: int) -> dict:
@@ -242,14 +192,9 @@ def mute_user(event: dict, admin_id: int) -> dict:
         duration = body.get('duration', 60)
         
         if not username:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'username required'}),
-                'isBase64Encoded': False
-            }
+            return json_response(400, {'error': 'username required'})
         
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_conn()
         cur = conn.cursor()
         
         cur.execute("SELECT id FROM users WHERE username = %s", (username,))
@@ -257,44 +202,30 @@ def mute_user(event: dict, admin_id: int) -> dict:
         
         if not user:
             cur.close()
-            conn.close()
-            return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'User not found'}),
-                'isBase64Encoded': False
-            }
+            release_conn(conn)
+            return json_response(404, {'error': 'User not found'})
         
         user_id = user[0]
         expires_at = datetime.utcnow() + timedelta(minutes=duration)
         
         cur.execute("""
-            INSERT INTO mutes (user_id, muted_by_id, reason, duration, muted_at, expires_at, is_active)
-            VALUES (%s, %s, %s, %s, %s, %s, TRUE)
-        """, (user_id, admin_id, reason, duration, datetime.utcnow(), expires_at))
+            INSERT INTO mutes (user_id, muted_by_id, reason, duration, muted_at, expires_at, is_active, updated_at)
+            VALUES (%s, %s, %s, %s, %s, %s, TRUE, %s)
+        """, (user_id, admin_id, reason, duration, datetime.utcnow(), expires_at, datetime.utcnow()))
         
         cur.execute("""
             INSERT INTO admin_logs (admin_id, action_type, target_user_id, details, created_at)
             VALUES (%s, 'MUTE', %s, %s, %s)
         """, (admin_id, user_id, f'Reason: {reason}, Duration: {duration}m', datetime.utcnow()))
         
+        bump_cache_generation(cur, ('principals',))
         conn.commit()
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 201,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'message': 'User muted'}),
-            'isBase64Encoded': False
-        }
+        release_conn(conn)
+        
+        return json_response(201, {'message': 'User muted'})
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
 
 
 def unmute_user(event: dict, admin_id: int) -> dict:
@@ -303,14 +234,9 @@ def unmute_user(event: dict, admin_id: int) -> dict:
         username = body.get('username')
         
         if not username:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'username required'}),
-                'isBase64Encoded': False
-            }
+            return json_response(400, {'error': 'username required'})
         
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_conn()
         cur = conn.cursor()
         
         cur.execute("SELECT id FROM users WHERE username = %s", (username,))
@@ -318,40 +244,132 @@ def unmute_user(event: dict, admin_id: int) -> dict:
         
         if not user:
             cur.close()
-            conn.close()
-            return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'User not found'}),
-                'isBase64Encoded': False
-            }
+            release_conn(conn)
+            return json_response(404, {'error': 'User not found'})
         
         user_id = user[0]
         
-        cur.execute("UPDATE mutes SET is_active = FALSE WHERE user_id = %s AND is_active = TRUE", (user_id,))
+        cur.execute(
+            "UPDATE mutes SET is_active = FALSE, updated_at = %s WHERE user_id = %s AND is_active = TRUE",
+            (datetime.utcnow(), user_id)
+        )
         
         cur.execute("""
             INSERT INTO admin_logs (admin_id, action_type, target_user_id, details, created_at)
             VALUES (%s, 'UNMUTE', %s, 'User unmuted', %s)
         """, (admin_id, user_id, datetime.utcnow()))
         
+        bump_cache_generation(cur, ('principals',))
+        conn.commit()
+        cur.close()
+        release_conn(conn)
+        
+        return json_response(200, {'message': 'User unmuted'})
+    except Exception as e:
+        return json_response(500, {'error': str(e)})
+
+
+def bulk_moderate(event: dict, admin_id: int) -> dict:
+    try:
+        body = json.loads(event.get('body', '{}'))
+        action = body.get('action')
+        usernames = list(dict.fromkeys(name for name in body.get('usernames', []) if name))
+        reason = body.get('reason', 'No reason provided')
+        
+        if action not in BULK_ACTIONS or not usernames:
+            return json_response(400, {'error': f"usernames and action ({', '.join(BULK_ACTIONS)}) required"})
+        
+        if len(usernames) > BULK_MAX_TARGETS:
+            return json_response(400, {'error': f'At most {BULK_MAX_TARGETS} usernames per call'})
+        
+        # Бан без срока бессрочный (как в /ban), у мута срок по умолчанию 60 минут
+        duration = body.get('duration', 60 if action == 'mute' else None)
+        if action == 'mute' or (action == 'ban' and duration is not None):
+            minimum = 1 if action == 'mute' else 0
+            if isinstance(duration, bool) or not isinstance(duration, int) or duration < minimum:
+                return json_response(400, {'error': 'duration must be a whole number of hours (ban) or minutes (mute)'})
+        
+        conn = get_conn()
+        cur = conn.cursor()
+        
+        cur.execute("SELECT username, id FROM users WHERE username = ANY(%s)", (usernames,))
+        found = dict(cur.fetchall())
+        user_ids = [found[name] for name in usernames if name in found]
+        now = datetime.utcnow()
+        
+        # Цели с уже действующей санкцией того же типа пропускаются и попадают в 'unchanged'
+        if action == 'ban':
+            expires_at = (now + timedelta(hours=duration)) if duration else None
+            cur.execute("""
+                INSERT INTO bans (user_id, banned_by_id, reason, duration, banned_at, expires_at, is_active, updated_at)
+                SELECT t.id, %s, %s, %s, %s, %s, TRUE, %s
+                FROM unnest(%s::int[]) AS t(id)
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM bans b
+                    WHERE b.user_id = t.id AND b.is_active = TRUE
+                      AND (b.expires_at IS NULL OR b.expires_at > %s)
+                )
+                RETURNING user_id
+            """, (admin_id, reason, duration, now, expires_at, now, user_ids, now))
+            action_type, details = 'BAN', f'Reason: {reason} (bulk)'
+        elif action == 'mute':
+            expires_at = now + timedelta(minutes=duration)
+            cur.execute("""
+                INSERT INTO mutes (user_id, muted_by_id, reason, duration, muted_at, expires_at, is_active, updated_at)
+                SELECT t.id, %s, %s, %s, %s, %s, TRUE, %s
+                FROM unnest(%s::int[]) AS t(id)
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM mutes m
+                    WHERE m.user_id = t.id AND m.is_active = TRUE AND m.expires_at > %s
+                )
+                RETURNING user_id
+            """, (admin_id, reason, duration, now, expires_at, now, user_ids, now))
+            action_type, details = 'MUTE', f'Reason: {reason}, Duration: {duration}m (bulk)'
+        elif action == 'unban':
+            cur.execute("""
+                UPDATE bans SET is_active = FALSE, updated_at = %s
+                WHERE user_id = ANY(%s) AND is_active = TRUE
+                RETURNING user_id
+            """, (now, user_ids))
+            action_type, details = 'UNBAN', 'User unbanned (bulk)'
+        else:
+            cur.execute("""
+                UPDATE mutes SET is_active = FALSE, updated_at = %s
+                WHERE user_id = ANY(%s) AND is_active = TRUE
+                RETURNING user_id
+            """, (now, user_ids))
+            action_type, details = 'UNMUTE', 'User unmuted (bulk)'
+        
+        affected = {row[0] for row in cur.fetchall()}
+        
+        if affected:
+            cur.execute("""
+                INSERT INTO admin_logs (admin_id, action_type, target_user_id, details, created_at)
+                SELECT %s, %s, unnest(%s::int[]), %s, %s
+            """, (admin_id, action_type, sorted(affected), details, now))
+            bump_cache_generation(cur, ('principals',))
+        
         conn.commit()
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'message': 'User unmuted'}),
-            'isBase64Encoded': False
-        }
+        release_conn(conn)
+        
+        results = []
+        for name in usernames:
+            if name not in found:
+                status = 'not_found'
+            elif found[name] in affected:
+                status = 'ok'
+            else:
+                status = 'unchanged'
+            results.append({'username': name, 'status': status})
+        
+        return json_response(200, {
+            'message': f'Bulk {action} complete',
+            'affected': len(affected),
+            'results': results
+        })
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
 
 
 def assign_faction_role(event: dict, admin_id: int) -> dict:
@@ -362,14 +380,9 @@ def assign_faction_role(event: dict, admin_id: int) -> dict:
         rank = body.get('rank')
         
         if not username or not faction_id:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'username and faction_id required'}),
-                'isBase64Encoded': False
-            }
+            return json_response(400, {'error': 'username and faction_id required'})
         
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_conn()
         cur = conn.cursor()
         
         cur.execute("SELECT id FROM users WHERE username = %s", (username,))
@@ -377,13 +390,8 @@ def assign_faction_role(event: dict, admin_id: int) -> dict:
         
         if not user:
             cur.close()
-            conn.close()
-            return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'User not found'}),
-                'isBase64Encoded': False
-            }
+            release_conn(conn)
+            return json_response(404, {'error': 'User not found'})
         
         user_id = user[0]
         
@@ -398,43 +406,232 @@ def assign_faction_role(event: dict, admin_id: int) -> dict:
             VALUES (%s, 'ASSIGN_FACTION', %s, %s, %s)
         """, (admin_id, user_id, f'Assigned to faction {faction_id}', datetime.utcnow()))
         
+        bump_cache_generation(cur, ('factions', 'profiles'))
         conn.commit()
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 201,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'message': 'Faction role assigned'}),
-            'isBase64Encoded': False
-        }
+        release_conn(conn)
+        
+        return json_response(201, {'message': 'Faction role assigned'})
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
+
+
+def escape_like(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def encode_search_cursor(score: float, user_id: int) -> str:
+    raw = f'{score!r}|{user_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_search_cursor(cursor: str) -> tuple:
+    padded = cursor + '=' * (-len(cursor) % 4)
+    score, user_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+    return float(score), int(user_id)
+
+
+def import_source(body: str, fmt: str) -> tuple:
+    if fmt == 'csv':
+        header = next(csv.reader(io.StringIO(body.split('\n', 1)[0])), [])
+        columns = [column.strip() for column in header]
+        if 'username' not in columns or not set(columns) <= set(IMPORT_COLUMNS):
+            raise ValueError(f"CSV header must name columns from: {', '.join(IMPORT_COLUMNS)}")
+        return columns, io.StringIO(body), 'FORMAT csv, HEADER true', None
+    
+    # NDJSON перекладывается в CSV без пустых строк, поэтому номера строк COPY
+    # переводятся обратно в номера строк исходного файла
+    source = io.StringIO()
+    writer = csv.writer(source)
+    line_numbers = []
+    for line_no, line in enumerate(body.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise ValueError(f'Line {line_no}: invalid JSON')
+        if not isinstance(record, dict):
+            raise ValueError(f'Line {line_no}: expected a JSON object')
+        writer.writerow([record.get(column) for column in IMPORT_COLUMNS])
+        line_numbers.append(line_no)
+    source.seek(0)
+    return list(IMPORT_COLUMNS), source, 'FORMAT csv', line_numbers
+
+
+def import_error(error, line_numbers) -> str:
+    message = error.diag.message_primary or str(error).strip()
+    match = re.search(r'line (\d+)', error.diag.context or '')
+    if not match:
+        return message
+    line_no = int(match.group(1))
+    if line_numbers is not None and 0 < line_no <= len(line_numbers):
+        line_no = line_numbers[line_no - 1]
+    return f'Line {line_no}: {message}'
+
+
+def import_faction_members(event: dict, admin_id: int) -> dict:
+    try:
+        query = event.get('queryStringParameters') or {}
+        faction_id = query.get('faction_id')
+        fmt = query.get('format', 'csv')
+        body = event.get('body') or ''
+        if event.get('isBase64Encoded'):
+            body = base64.b64decode(body).decode('utf-8')
+        
+        if not faction_id or fmt not in ('csv', 'ndjson') or not body.strip():
+            return json_response(400, {'error': 'faction_id, format (csv or ndjson) and a roster body required'})
+        
+        try:
+            columns, source, options, line_numbers = import_source(body, fmt)
+        except ValueError as e:
+            return json_response(400, {'error': str(e)})
+        
+        conn = get_conn()
+        cur = conn.cursor()
+        
+        cur.execute("SELECT id, name FROM factions WHERE id = %s", (faction_id,))
+        faction = cur.fetchone()
+        
+        if not faction:
+            cur.close()
+            release_conn(conn)
+            return json_response(404, {'error': 'Faction not found'})
+        
+        cur.execute("""
+            CREATE TEMP TABLE faction_import (
+                username TEXT,
+                rank TEXT,
+                is_general BOOLEAN
+            ) ON COMMIT DROP
+        """)
+        try:
+            cur.copy_expert(f"COPY faction_import ({', '.join(columns)}) FROM STDIN WITH ({options})", source)
+        except psycopg2.DataError as e:
+            cur.close()
+            release_conn(conn)
+            return json_response(400, {'error': import_error(e, line_numbers)})
+        
+        # Временные таблицы autovacuum не анализирует: без статистики планировщик считает
+        # faction_import большой и соединяет её с users через полный просмотр
+        cur.execute("ANALYZE faction_import")
+        cur.execute("SELECT COUNT(*) FROM faction_import")
+        total = cur.fetchone()[0]
+        
+        cur.execute("""
+            SELECT DISTINCT s.username
+            FROM faction_import s
+            LEFT JOIN users u ON u.username = s.username
+            WHERE u.id IS NULL
+            ORDER BY s.username
+        """)
+        unknown = [row[0] for row in cur.fetchall()]
+        
+        # Пустые rank и is_general (колонки нет в файле или значение не задано) не затирают
+        # уже сохранённые; is_general новых участников доводится до FALSE отдельным UPDATE,
+        # чтобы EXCLUDED.is_general оставался NULL для существующих строк
+        cur.execute("""
+            INSERT INTO faction_members (user_id, faction_id, rank, is_general, joined_at)
+            SELECT DISTINCT ON (u.id) u.id, %s, LEFT(s.rank, 100), s.is_general, %s
+            FROM faction_import s
+            JOIN users u ON u.username = s.username
+            ORDER BY u.id
+            ON CONFLICT (user_id, faction_id) DO UPDATE SET
+                rank = COALESCE(EXCLUDED.rank, faction_members.rank),
+                is_general = COALESCE(EXCLUDED.is_general, faction_members.is_general)
+            RETURNING user_id, (xmax = 0)
+        """, (faction[0], datetime.utcnow()))
+        
+        upserted = cur.fetchall()
+        new_member_ids = [row[0] for row in upserted if row[1]]
+        inserted = len(new_member_ids)
+        updated = len(upserted) - inserted
+        
+        if new_member_ids:
+            cur.execute("""
+                UPDATE faction_members SET is_general = FALSE
+                WHERE faction_id = %s AND user_id = ANY(%s) AND is_general IS NULL
+            """, (faction[0], new_member_ids))
+        
+        cur.execute("""
+            INSERT INTO admin_logs (admin_id, action_type, target_user_id, details, created_at)
+            VALUES (%s, 'IMPORT_FACTION', NULL, %s, %s)
+        """, (admin_id, f'Imported roster into faction {faction[1]}: {inserted} added, '
+                        f'{updated} updated, {len(unknown)} unknown of {total} rows', datetime.utcnow()))
+        
+        bump_cache_generation(cur, ('factions', 'profiles'))
+        conn.commit()
+        cur.close()
+        release_conn(conn)
+        
+        return json_response(200, {
+            'message': 'Roster imported',
+            'rows': total,
+            'inserted': inserted,
+            'updated': updated,
+            'unknown_count': len(unknown),
+            'unknown_usernames': unknown[:IMPORT_UNKNOWN_REPORT_MAX]
+        })
+    except Exception as e:
+        return json_response(500, {'error': str(e)})
 
 
 def get_users(event: dict) -> dict:
     try:
-        search = event.get('queryStringParameters', {}).get('search', '')
+        query = event.get('queryStringParameters') or {}
+        search = query.get('search', '').strip()
+        cursor = query.get('cursor')
+        
+        if cursor:
+            try:
+                cursor_score, cursor_id = decode_search_cursor(cursor)
+            except Exception:
+                return json_response(400, {'error': 'Invalid cursor'})
         
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_conn()
         cur = conn.cursor()
         
         if search:
-            cur.execute("""
-                SELECT u.id, u.username, u.nickname, u.avatar_url, u.status_text, u.is_owner,
-                       a.admin_rank, b.is_active as is_banned, m.is_active as is_muted
-                FROM users u
-                LEFT JOIN admins a ON u.id = a.user_id AND a.is_active = TRUE
-                LEFT JOIN bans b ON u.id = b.user_id AND b.is_active = TRUE
-                LEFT JOIN mutes m ON u.id = m.user_id AND m.is_active = TRUE
-                WHERE u.username ILIKE %s OR u.nickname ILIKE %s
-                LIMIT 50
-            """, (f'%{search}%', f'%{search}%'))
+            # Короткие запросы (меньше трёх символов) триграммы не покрывают,
+            # поэтому для них остаётся только поиск по префиксу
+            if len(search) < 3:
+                match = "(lower(u.username) LIKE %(prefix)s OR lower(u.nickname) LIKE %(prefix)s)"
+            else:
+                match = """(u.username ILIKE %(contains)s OR u.nickname ILIKE %(contains)s
+                           OR u.username %% %(search)s OR u.nickname %% %(search)s)"""
+            
+            params = {
+                'search': search,
+                'prefix': escape_like(search.lower()) + '%',
+                'contains': '%' + escape_like(search) + '%',
+                'limit': USERS_PAGE_SIZE + 1
+            }
+            after = ''
+            if cursor:
+                after = "WHERE score < %(cursor_score)s OR (score = %(cursor_score)s AND id > %(cursor_id)s)"
+                params.update(cursor_score=cursor_score, cursor_id=cursor_id)
+            
+            cur.execute(f"SET LOCAL statement_timeout = {USERS_SEARCH_TIMEOUT_MS}")
+            cur.execute(f"""
+                SELECT id, username, nickname, avatar_url, status_text, is_owner,
+                       admin_rank, is_banned, is_muted, score
+                FROM (
+                    SELECT u.id, u.username, u.nickname, u.avatar_url, u.status_text, u.is_owner,
+                           a.admin_rank, b.is_active as is_banned, m.is_active as is_muted,
+                           (CASE WHEN lower(u.username) LIKE %(prefix)s OR lower(u.nickname) LIKE %(prefix)s
+                                 THEN 1 ELSE 0 END
+                            + GREATEST(similarity(COALESCE(u.username, ''), %(search)s),
+                                       similarity(COALESCE(u.nickname, ''), %(search)s)))::float8 AS score
+                    FROM users u
+                    LEFT JOIN admins a ON u.id = a.user_id AND a.is_active = TRUE
+                    LEFT JOIN bans b ON u.id = b.user_id AND b.is_active = TRUE
+                    LEFT JOIN mutes m ON u.id = m.user_id AND m.is_active = TRUE
+                    WHERE {match}
+                ) ranked
+                {after}
+                ORDER BY score DESC, id ASC
+                LIMIT %(limit)s
+            """, params)
         else:
             cur.execute("""
                 SELECT u.id, u.username, u.nickname, u.avatar_url, u.status_text, u.is_owner,
@@ -447,8 +644,14 @@ def get_users(event: dict) -> dict:
                 LIMIT 50
             """)
         
+        rows = cur.fetchall()
+        next_cursor = None
+        if search and len(rows) > USERS_PAGE_SIZE:
+            rows = rows[:USERS_PAGE_SIZE]
+            next_cursor = encode_search_cursor(rows[-1][9], rows[-1][0])
+        
         users = []
-        for row in cur.fetchall():
+        for row in rows:
             users.append({
                 'id': row[0],
                 'username': row[1],
@@ -462,40 +665,70 @@ def get_users(event: dict) -> dict:
             })
         
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'users': users}),
-            'isBase64Encoded': False
-        }
+        release_conn(conn)
+        
+        return json_response(200, {'users': users, 'next_cursor': next_cursor})
+    except psycopg2.errors.QueryCanceled:
+        return json_response(503, {'error': 'Search timed out, refine the query'})
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
 
 
-def get_admin_logs() -> dict:
+def get_admin_logs(event: dict) -> dict:
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        query = event.get('queryStringParameters') or {}
+        limit = parse_limit(query.get('limit'), LOGS_PAGE_SIZE, LOGS_PAGE_MAX)
+        
+        conditions = []
+        params = []
+        
+        if query.get('action_type'):
+            conditions.append("l.action_type = %s")
+            params.append(query['action_type'])
+        if query.get('admin'):
+            conditions.append("l.admin_id = (SELECT id FROM users WHERE username = %s)")
+            params.append(query['admin'])
+        if query.get('target'):
+            conditions.append("l.target_user_id = (SELECT id FROM users WHERE username = %s)")
+            params.append(query['target'])
+        
+        try:
+            if query.get('from'):
+                conditions.append("l.created_at >= %s")
+                params.append(datetime.fromisoformat(query['from']))
+            if query.get('to'):
+                conditions.append("l.created_at < %s")
+                params.append(datetime.fromisoformat(query['to']))
+            if query.get('cursor'):
+                conditions.append("(l.created_at, l.id) < (%s, %s)")
+                params.extend(decode_cursor(query['cursor']))
+        except Exception:
+            return json_response(400, {'error': 'Invalid from, to or cursor'})
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        params.append(limit + 1)
+        
+        conn = get_conn()
         cur = conn.cursor()
         
-        cur.execute("""
+        cur.execute(f"""
             SELECT l.id, l.action_type, l.details, l.created_at,
                    u1.username as admin_username, u2.username as target_username
             FROM admin_logs l
             LEFT JOIN users u1 ON l.admin_id = u1.id
             LEFT JOIN users u2 ON l.target_user_id = u2.id
-            ORDER BY l.created_at DESC
-            LIMIT 100
-        """)
+            {where}
+            ORDER BY l.created_at DESC, l.id DESC
+            LIMIT %s
+        """, params)
+        
+        rows = cur.fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][3], rows[-1][0]) if has_more else None
         
         logs = []
-        for row in cur.fetchall():
+        for row in rows:
             logs.append({
                 'id': row[0],
                 'action_type': row[1],
@@ -506,18 +739,11 @@ def get_admin_logs() -> dict:
             })
         
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'logs': logs}),
-            'isBase64Encoded': False
-        }
+        release_conn(conn)
+        
+        return json_response(200, {'logs': logs, 'next_cursor': next_cursor})
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
+
+
+mark_imported(_import_started)
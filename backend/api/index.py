@@ -1,26 +1,29 @@
 """Универсальный API для Owner Panel, профилей и фракций"""
+import time
+_import_started = time.perf_counter()
+
 import json
-import os
-import jwt
-import psycopg2
-from datetime import datetime, timedelta
+from datetime import datetime
+
+from core import (
+    bump_cache_generation, cached_read, conditional_read, get_conn, get_token, json_response,
+    jwt, make_etag, mark_imported, preflight_response, release_conn, resolve_principal, serve
+)
+
+
+PREFLIGHT_RESPONSE = preflight_response(
+    'GET, POST, PUT, DELETE, OPTIONS',
+    'Content-Type, X-Authorization, If-None-Match, If-Modified-Since'
+)
+
 
 def handler(event: dict, context) -> dict:
+    return serve(event, 'api', route, PREFLIGHT_RESPONSE)
+
+
+def route(event: dict) -> dict:
     method = event.get('httpMethod', 'GET')
     
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Authorization',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
-    
     path = event.get('params', {}).get('path', '')
     
     if path.startswith('/owner/'):
@@ -30,44 +33,33 @@ def handler(event: dict, context) -> dict:
     elif path.startswith('/factions/'):
         return handle_factions(event, method, path)
     
-    return {
-        'statusCode': 404,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Not found'}),
-        'isBase64Encoded': False
-    }
+    return json_response(404, {'error': 'Not found'})
 
 
 def verify_owner(event: dict) -> tuple:
-    auth_header = event.get('headers', {}).get('X-Authorization', '')
-    token = auth_header.replace('Bearer ', '')
+    token = get_token(event)
     
     if not token:
         return None, None
     
     try:
-        payload = jwt.decode(token, os.environ.get('JWT_SECRET', 'default_secret'), algorithms=['HS256'])
-        if not payload.get('is_owner'):
+        principal = resolve_principal(token)
+        if not principal or not principal['is_owner']:
             return None, None
-        return payload, payload['user_id']
-    except:
+        return principal, principal['id']
+    except (jwt.InvalidTokenError, KeyError):
         return None, None
 
 
 def handle_owner(event: dict, method: str, path: str) -> dict:
-    payload, user_id = verify_owner(event)
+    principal, user_id = verify_owner(event)
     
-    if not payload:
-        return {
-            'statusCode': 403,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Owner access only'}),
-            'isBase64Encoded': False
-        }
+    if not principal:
+        return json_response(403, {'error': 'Owner access only'})
     
     if '/owner/admins' in path:
         if method == 'GET':
-            return get_admins()
+            return cached_read(event, 'admins', 'admins', get_admins)
         elif method == 'POST':
             return add_admin(event, user_id)
         elif method == 'DELETE':
@@ -79,18 +71,13 @@ def handle_owner(event: dict, method: str, path: str) -> dict:
             return update_admin_code(event)
     elif '/owner/roles' in path:
         if method == 'GET':
-            return get_roles()
+            return cached_read(event, 'roles', 'roles', get_roles)
         elif method == 'POST':
             return create_role(event, user_id)
         elif method == 'PUT':
             return update_role(event)
     
-    return {
-        'statusCode': 404,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Not found'}),
-        'isBase64Encoded': False
-    }
+    return json_response(404, {'error': 'Not found'})
 
 
 def handle_profile(event: dict, method: str, path: str) -> dict:
@@ -100,36 +87,32 @@ def handle_profile(event: dict, method: str, path: str) -> dict:
         return update_profile(event)
     elif len(parts) >= 3:
         username = parts[2]
-        return get_profile(username)
+        return cached_read(event, 'profiles', f'profile:{username}', lambda: conditional_read(
+            event, lambda cur: get_profile_version(cur, username), lambda: get_profile(username)
+        ))
     
-    return {
-        'statusCode': 404,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Not found'}),
-        'isBase64Encoded': False
-    }
+    return json_response(404, {'error': 'Not found'})
 
 
 def handle_factions(event: dict, method: str, path: str) -> dict:
     if '/factions/list' in path:
-        return get_factions()
+        return cached_read(event, 'factions', 'factions:list', lambda: conditional_read(
+            event, get_factions_version, get_factions
+        ))
     else:
         parts = path.split('/')
         if len(parts) >= 3:
             faction_id = parts[2]
-            return get_faction(faction_id)
+            return cached_read(event, 'factions', f'faction:{faction_id}', lambda: conditional_read(
+                event, lambda cur: get_faction_version(cur, faction_id), lambda: get_faction(faction_id)
+            ))
     
-    return {
-        'statusCode': 404,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Not found'}),
-        'isBase64Encoded': False
-    }
+    return json_response(404, {'error': 'Not found'})
 
 
 def get_admins() -> dict:
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_conn()
         cur = conn.cursor()
         
         cur.execute("""
@@ -157,21 +140,11 @@ def get_admins() -> dict:
             })
         
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'admins': admins}),
-            'isBase64Encoded': False
-        }
+        release_conn(conn)
+        
+        return json_response(200, {'admins': admins})
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
 
 
 def add_admin(event: dict, appointed_by: int) -> dict:
@@ -182,14 +155,9 @@ def add_admin(event: dict, appointed_by: int) -> dict:
         role_id = body.get('role_id')
         
         if not username or not admin_rank:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Username and admin_rank required'}),
-                'isBase64Encoded': False
-            }
-        
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+            return json_response(400, {'error': 'Username and admin_rank required'})
+        
+        conn = get_conn()
         cur = conn.cursor()
         
         cur.execute("SELECT id FROM users WHERE username = %s", (username,))
@@ -197,13 +165,8 @@ def add_admin(event: dict, appointed_by: int) -> dict:
         
         if not user:
             cur.close()
-            conn.close()
-            return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'User not found'}),
-                'isBase64Encoded': False
-            }
+            release_conn(conn)
+            return json_response(404, {'error': 'User not found'})
         
         user_id = user[0]
         
@@ -224,23 +187,14 @@ def add_admin(event: dict, appointed_by: int) -> dict:
             VALUES (%s, 'ADMIN_APPOINTED', %s, %s, %s)
         """, (appointed_by, user_id, f'Appointed as {admin_rank}', datetime.utcnow()))
         
+        bump_cache_generation(cur, ('admins', 'profiles', 'principals'))
         conn.commit()
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 201,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'message': 'Admin added', 'admin_id': admin_id}),
-            'isBase64Encoded': False
-        }
+        release_conn(conn)
+        
+        return json_response(201, {'message': 'Admin added', 'admin_id': admin_id})
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
 
 
 def remove_admin(event: dict) -> dict:
@@ -249,61 +203,37 @@ def remove_admin(event: dict) -> dict:
         admin_id = body.get('admin_id')
         
         if not admin_id:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'admin_id required'}),
-                'isBase64Encoded': False
-            }
-        
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+            return json_response(400, {'error': 'admin_id required'})
+        
+        conn = get_conn()
         cur = conn.cursor()
         
         cur.execute("UPDATE admins SET is_active = FALSE WHERE id = %s", (admin_id,))
+        bump_cache_generation(cur, ('admins', 'profiles', 'principals'))
         conn.commit()
         
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'message': 'Admin removed'}),
-            'isBase64Encoded': False
-        }
+        release_conn(conn)
+        
+        return json_response(200, {'message': 'Admin removed'})
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
 
 
 def get_admin_code() -> dict:
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_conn()
         cur = conn.cursor()
         
         cur.execute("SELECT code FROM admin_codes WHERE is_active = TRUE ORDER BY created_at DESC LIMIT 1")
         code = cur.fetchone()
         
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'code': code[0] if code else None}),
-            'isBase64Encoded': False
-        }
+        release_conn(conn)
+        
+        return json_response(200, {'code': code[0] if code else None})
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
 
 
 def update_admin_code(event: dict) -> dict:
@@ -312,14 +242,9 @@ def update_admin_code(event: dict) -> dict:
         new_code = body.get('code')
         
         if not new_code:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'code required'}),
-                'isBase64Encoded': False
-            }
-        
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+            return json_response(400, {'error': 'code required'})
+        
+        conn = get_conn()
         cur = conn.cursor()
         
         cur.execute("UPDATE admin_codes SET is_active = FALSE WHERE is_active = TRUE")
@@ -330,26 +255,16 @@ def update_admin_code(event: dict) -> dict:
         
         conn.commit()
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'message': 'Admin code updated', 'code': new_code}),
-            'isBase64Encoded': False
-        }
+        release_conn(conn)
+        
+        return json_response(200, {'message': 'Admin code updated', 'code': new_code})
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
 
 
 def get_roles() -> dict:
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_conn()
         cur = conn.cursor()
         
         cur.execute("""
@@ -371,21 +286,11 @@ def get_roles() -> dict:
             })
         
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'roles': roles}),
-            'isBase64Encoded': False
-        }
+        release_conn(conn)
+        
+        return json_response(200, {'roles': roles})
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
 
 
 def create_role(event: dict, created_by: int) -> dict:
@@ -398,14 +303,9 @@ def create_role(event: dict, created_by: int) -> dict:
         is_admin_role = body.get('is_admin_role', False)
         
         if not name:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'name required'}),
-                'isBase64Encoded': False
-            }
-        
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+            return json_response(400, {'error': 'name required'})
+        
+        conn = get_conn()
         cur = conn.cursor()
         
         cur.execute("""
@@ -415,24 +315,15 @@ def create_role(event: dict, created_by: int) -> dict:
         """, (name, color, permissions, icon, is_admin_role, str(created_by), datetime.utcnow()))
         
         role_id = cur.fetchone()[0]
+        bump_cache_generation(cur, ('roles',))
         conn.commit()
         
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 201,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'message': 'Role created', 'role_id': role_id}),
-            'isBase64Encoded': False
-        }
+        release_conn(conn)
+        
+        return json_response(201, {'message': 'Role created', 'role_id': role_id})
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
 
 
 def update_role(event: dict) -> dict:
@@ -443,14 +334,9 @@ def update_role(event: dict) -> dict:
         color = body.get('color')
         
         if not role_id:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'role_id required'}),
-                'isBase64Encoded': False
-            }
-        
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+            return json_response(400, {'error': 'role_id required'})
+        
+        conn = get_conn()
         cur = conn.cursor()
         
         updates = []
@@ -470,29 +356,32 @@ def update_role(event: dict) -> dict:
             
             query = f"UPDATE custom_roles SET {', '.join(updates)} WHERE id = %s"
             cur.execute(query, params)
+            bump_cache_generation(cur, ('roles', 'admins', 'profiles', 'principals'))
             conn.commit()
         
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'message': 'Role updated'}),
-            'isBase64Encoded': False
-        }
+        release_conn(conn)
+        
+        return json_response(200, {'message': 'Role updated'})
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
+
+
+def get_profile_version(cur, username: str):
+    # Админ-статус, роль и фракции профиля меняются только с bump_cache_generation('profiles')
+    cur.execute("""
+        SELECT u.id, u.updated_at, g.generation, GREATEST(u.updated_at, g.updated_at)
+        FROM users u
+        LEFT JOIN cache_generations g ON g.scope = 'profiles'
+        WHERE u.username = %s
+    """, (username,))
+    row = cur.fetchone()
+    return (make_etag(row[:3]), row[3]) if row else None
 
 
 def get_profile(username: str) -> dict:
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_conn()
         cur = conn.cursor()
         
         cur.execute("""
@@ -509,13 +398,8 @@ def get_profile(username: str) -> dict:
         
         if not user:
             cur.close()
-            conn.close()
-            return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'User not found'}),
-                'isBase64Encoded': False
-            }
+            release_conn(conn)
+            return json_response(404, {'error': 'User not found'})
         
         user_id = user[0]
         
@@ -538,51 +422,39 @@ def get_profile(username: str) -> dict:
             })
         
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
-                'id': user[0],
-                'username': user[1],
-                'nickname': user[2],
-                'avatar_url': user[3],
-                'bio': user[4],
-                'status_text': user[5],
-                'discord_link': user[6],
-                'created_at': user[7].isoformat() if user[7] else None,
-                'is_owner': user[8],
-                'admin_rank': user[9],
-                'role': {'name': user[10], 'color': user[11]} if user[10] else None,
-                'factions': factions
-            }),
-            'isBase64Encoded': False
-        }
+        release_conn(conn)
+        
+        return json_response(200, {
+            'id': user[0],
+            'username': user[1],
+            'nickname': user[2],
+            'avatar_url': user[3],
+            'bio': user[4],
+            'status_text': user[5],
+            'discord_link': user[6],
+            'created_at': user[7].isoformat() if user[7] else None,
+            'is_owner': user[8],
+            'admin_rank': user[9],
+            'role': {'name': user[10], 'color': user[11]} if user[10] else None,
+            'factions': factions
+        })
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
 
 
 def update_profile(event: dict) -> dict:
     try:
-        auth_header = event.get('headers', {}).get('X-Authorization', '')
-        token = auth_header.replace('Bearer ', '')
+        token = get_token(event)
         
         if not token:
-            return {
-                'statusCode': 401,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'No token provided'}),
-                'isBase64Encoded': False
-            }
+            return json_response(401, {'error': 'No token provided'})
+        
+        principal = resolve_principal(token)
         
-        payload = jwt.decode(token, os.environ.get('JWT_SECRET', 'default_secret'), algorithms=['HS256'])
-        user_id = payload['user_id']
+        if not principal:
+            return json_response(401, {'error': 'User not found'})
+        
+        user_id = principal['id']
         
         body = json.loads(event.get('body', '{}'))
         nickname = body.get('nickname')
@@ -591,7 +463,7 @@ def update_profile(event: dict) -> dict:
         status_text = body.get('status_text')
         discord_link = body.get('discord_link')
         
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_conn()
         cur = conn.cursor()
         
         updates = []
@@ -620,66 +492,63 @@ def update_profile(event: dict) -> dict:
             
             query = f"UPDATE users SET {', '.join(updates)} WHERE id = %s"
             cur.execute(query, params)
+            bump_cache_generation(cur, ('profiles', 'admins', 'factions', 'principals'))
             conn.commit()
         
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'message': 'Profile updated'}),
-            'isBase64Encoded': False
-        }
+        release_conn(conn)
+        
+        return json_response(200, {'message': 'Profile updated'})
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
+
+
+def get_factions_version(cur):
+    # Все записи во фракции и состав идут через bump_cache_generation('factions'),
+    # поэтому поколение области — дешёвый и монотонный валидатор списка
+    cur.execute("SELECT generation, updated_at FROM cache_generations WHERE scope = 'factions'")
+    row = cur.fetchone()
+    return (make_etag(('factions', row[0])), row[1]) if row else None
 
 
 def get_factions() -> dict:
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_conn()
         cur = conn.cursor()
         
         cur.execute("""
-            SELECT id, name, type, description, color, icon, is_open
-            FROM factions
+            SELECT f.id, f.name, f.type, f.description, f.color, f.icon, f.is_open,
+                   COALESCE(mc.members_count, 0), COALESCE(g.generals, '[]'::json)
+            FROM factions f
+            LEFT JOIN (
+                SELECT faction_id, COUNT(*) AS members_count
+                FROM faction_members
+                GROUP BY faction_id
+            ) mc ON mc.faction_id = f.id
+            LEFT JOIN (
+                SELECT fm.faction_id,
+                       json_agg(json_build_object(
+                           'username', u.username,
+                           'nickname', u.nickname,
+                           'avatar_url', u.avatar_url,
+                           'rank', fm.rank
+                       )) AS generals
+                FROM faction_members fm
+                JOIN users u ON fm.user_id = u.id
+                WHERE fm.is_general = TRUE
+                GROUP BY fm.faction_id
+            ) g ON g.faction_id = f.id
             ORDER BY 
-                CASE type 
+                CASE f.type 
                     WHEN 'open' THEN 1
                     WHEN 'closed' THEN 2
                     WHEN 'criminal' THEN 3
                 END,
-                name
+                f.name
         """)
         
         factions = []
         for row in cur.fetchall():
-            faction_id = row[0]
-            
-            cur.execute("SELECT COUNT(*) FROM faction_members WHERE faction_id = %s", (faction_id,))
-            members_count = cur.fetchone()[0]
-            
-            cur.execute("""
-                SELECT u.username, u.nickname, u.avatar_url, fm.rank
-                FROM faction_members fm
-                JOIN users u ON fm.user_id = u.id
-                WHERE fm.faction_id = %s AND fm.is_general = TRUE
-            """, (faction_id,))
-            
-            generals = []
-            for g in cur.fetchall():
-                generals.append({
-                    'username': g[0],
-                    'nickname': g[1],
-                    'avatar_url': g[2],
-                    'rank': g[3]
-                })
-            
             factions.append({
                 'id': row[0],
                 'name': row[1],
@@ -688,31 +557,31 @@ def get_factions() -> dict:
                 'color': row[4],
                 'icon': row[5],
                 'is_open': row[6],
-                'members_count': members_count,
-                'generals': generals
+                'members_count': row[7],
+                'generals': row[8]
             })
         
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'factions': factions}),
-            'isBase64Encoded': False
-        }
+        release_conn(conn)
+        
+        return json_response(200, {'factions': factions})
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
+
+
+def get_faction_version(cur, faction_id: str):
+    cur.execute("""
+        SELECT g.generation, g.updated_at
+        FROM cache_generations g
+        WHERE g.scope = 'factions' AND EXISTS (SELECT 1 FROM factions WHERE id = %s)
+    """, (faction_id,))
+    row = cur.fetchone()
+    return (make_etag(('faction', faction_id, row[0])), row[1]) if row else None
 
 
 def get_faction(faction_id: str) -> dict:
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_conn()
         cur = conn.cursor()
         
         cur.execute("""
@@ -725,13 +594,8 @@ def get_faction(faction_id: str) -> dict:
         
         if not faction:
             cur.close()
-            conn.close()
-            return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Faction not found'}),
-                'isBase64Encoded': False
-            }
+            release_conn(conn)
+            return json_response(404, {'error': 'Faction not found'})
         
         cur.execute("""
             SELECT u.id, u.username, u.nickname, u.avatar_url, fm.rank, fm.is_general, fm.joined_at
@@ -754,28 +618,21 @@ def get_faction(faction_id: str) -> dict:
             })
         
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
-                'id': faction[0],
-                'name': faction[1],
-                'type': faction[2],
-                'description': faction[3],
-                'color': faction[4],
-                'icon': faction[5],
-                'is_open': faction[6],
-                'created_at': faction[7].isoformat() if faction[7] else None,
-                'members': members
-            }),
-            'isBase64Encoded': False
-        }
+        release_conn(conn)
+        
+        return json_response(200, {
+            'id': faction[0],
+            'name': faction[1],
+            'type': faction[2],
+            'description': faction[3],
+            'color': faction[4],
+            'icon': faction[5],
+            'is_open': faction[6],
+            'created_at': faction[7].isoformat() if faction[7] else None,
+            'members': members
+        })
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
+
+
+mark_imported(_import_started)
@@ -1,27 +1,29 @@
 """Система авторизации с логином и паролем"""
+import time
+_import_started = time.perf_counter()
+
 import json
 import os
-import jwt
-import psycopg2
 import hashlib
 from datetime import datetime, timedelta
 
+from core import (
+    get_conn, get_token, json_response, jwt, mark_imported, preflight_response, release_conn,
+    resolve_principal, serve
+)
+
+
+PREFLIGHT_RESPONSE = preflight_response(
+    'GET, POST, OPTIONS',
+    'Content-Type, X-Authorization'
+)
+
+
 def handler(event: dict, context) -> dict:
-    method = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Authorization',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
-    
+    return serve(event, 'auth', route, PREFLIGHT_RESPONSE)
+
+
+def route(event: dict) -> dict:
     path = event.get('params', {}).get('path', '')
     
     if path == '/register':
@@ -33,12 +35,7 @@ def handler(event: dict, context) -> dict:
     elif path == '/logout':
         return logout()
     
-    return {
-        'statusCode': 404,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Not found'}),
-        'isBase64Encoded': False
-    }
+    return json_response(404, {'error': 'Not found'})
 
 
 def hash_password(password: str) -> str:
@@ -53,31 +50,21 @@ def register(event: dict) -> dict:
         nickname = body.get('nickname', username)
         
         if not username or not password:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Username and password required'}),
-                'isBase64Encoded': False
-            }
+            return json_response(400, {'error': 'Username and password required'})
         
         if username == 'TOURIST_WAGNERA':
             password_hash = hash_password('wagnera_tut$45$')
         else:
             password_hash = hash_password(password)
         
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_conn()
         cur = conn.cursor()
         
         cur.execute("SELECT id FROM users WHERE username = %s", (username,))
         if cur.fetchone():
             cur.close()
-            conn.close()
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Username already exists'}),
-                'isBase64Encoded': False
-            }
+            release_conn(conn)
+            return json_response(400, {'error': 'Username already exists'})
         
         is_owner = (username == 'TOURIST_WAGNERA')
         
@@ -99,35 +86,23 @@ def register(event: dict) -> dict:
         }, os.environ.get('JWT_SECRET', 'default_secret'), algorithm='HS256')
         
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 201,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*',
-                'X-Set-Cookie': f'auth_token={token}; Path=/; HttpOnly; Secure; SameSite=Lax; Max-Age=2592000'
-            },
-            'body': json.dumps({
-                'token': token,
-                'user': {
-                    'id': user_id,
-                    'username': username,
-                    'nickname': nickname,
-                    'is_owner': is_owner,
-                    'is_admin': False
-                }
-            }),
-            'isBase64Encoded': False
-        }
+        release_conn(conn)
+        
+        return json_response(201, {
+            'token': token,
+            'user': {
+                'id': user_id,
+                'username': username,
+                'nickname': nickname,
+                'is_owner': is_owner,
+                'is_admin': False
+            }
+        }, headers={
+            'X-Set-Cookie': f'auth_token={token}; Path=/; HttpOnly; Secure; SameSite=Lax; Max-Age=2592000'
+        })
     
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
 
 
 def login(event: dict) -> dict:
@@ -137,14 +112,9 @@ def login(event: dict) -> dict:
         password = body.get('password')
         
         if not username or not password:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Username and password required'}),
-                'isBase64Encoded': False
-            }
+            return json_response(400, {'error': 'Username and password required'})
         
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_conn()
         cur = conn.cursor()
         
         password_hash = hash_password(password)
@@ -162,13 +132,8 @@ def login(event: dict) -> dict:
         
         if not user:
             cur.close()
-            conn.close()
-            return {
-                'statusCode': 401,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Invalid credentials'}),
-                'isBase64Encoded': False
-            }
+            release_conn(conn)
+            return json_response(401, {'error': 'Invalid credentials'})
         
         cur.execute("UPDATE users SET last_login = %s WHERE id = %s", (datetime.utcnow(), user[0]))
         conn.commit()
@@ -182,92 +147,11 @@ def login(event: dict) -> dict:
         }, os.environ.get('JWT_SECRET', 'default_secret'), algorithm='HS256')
         
         cur.close()
-        conn.close()
+        release_conn(conn)
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*',
-                'X-Set-Cookie': f'auth_token={token}; Path=/; HttpOnly; Secure; SameSite=Lax; Max-Age=2592000'
-            },
-            'body': json.dumps({
-                'token': token,
-                'user': {
-                    'id': user[0],
-                    'username': user[1],
-                    'nickname': user[2],
-                    'avatar_url': user[3],
-                    'is_owner': user[4],
-                    'is_admin': bool(user[7]),
-                    'bio': user[5],
-                    'status_text': user[6],
-                    'admin_rank': user[8],
-                    'role': {
-                        'name': user[9],
-                        'color': user[10]
-                    } if user[9] else None
-                }
-            }),
-            'isBase64Encoded': False
-        }
-    
-    except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
-
-
-def get_current_user(event: dict) -> dict:
-    try:
-        auth_header = event.get('headers', {}).get('X-Authorization', '')
-        token = auth_header.replace('Bearer ', '')
-        
-        if not token:
-            return {
-                'statusCode': 401,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'No token provided'}),
-                'isBase64Encoded': False
-            }
-        
-        payload = jwt.decode(token, os.environ.get('JWT_SECRET', 'default_secret'), algorithms=['HS256'])
-        user_id = payload['user_id']
-        
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        
-        cur.execute("""
-            SELECT u.id, u.username, u.nickname, u.avatar_url, u.is_owner, u.bio, u.status_text,
-                   a.id as admin_id, a.admin_rank, cr.name as role_name, cr.color as role_color
-            FROM users u
-            LEFT JOIN admins a ON u.id = a.user_id AND a.is_active = TRUE
-            LEFT JOIN custom_roles cr ON a.role_id = cr.id
-            WHERE u.id = %s
-        """, (user_id,))
-        
-        user = cur.fetchone()
-        
-        if not user:
-            cur.close()
-            conn.close()
-            return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'User not found'}),
-                'isBase64Encoded': False
-            }
-        
-        cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
+        return json_response(200, {
+            'token': token,
+            'user': {
                 'id': user[0],
                 'username': user[1],
                 'nickname': user[2],
@@ -281,34 +165,39 @@ def get_current_user(event: dict) -> dict:
                     'name': user[9],
                     'color': user[10]
                 } if user[9] else None
-            }),
-            'isBase64Encoded': False
-        }
+            }
+        }, headers={
+            'X-Set-Cookie': f'auth_token={token}; Path=/; HttpOnly; Secure; SameSite=Lax; Max-Age=2592000'
+        })
+    
+    except Exception as e:
+        return json_response(500, {'error': str(e)})
+
+
+def get_current_user(event: dict) -> dict:
+    try:
+        token = get_token(event)
+        
+        if not token:
+            return json_response(401, {'error': 'No token provided'})
+        
+        principal = resolve_principal(token)
+        
+        if not principal:
+            return json_response(404, {'error': 'User not found'})
+        
+        return json_response(200, principal)
     
     except jwt.ExpiredSignatureError:
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Token expired'}),
-            'isBase64Encoded': False
-        }
+        return json_response(401, {'error': 'Token expired'})
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
 
 
 def logout() -> dict:
-    return {
-        'statusCode': 200,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',
-            'X-Set-Cookie': 'auth_token=; Path=/; HttpOnly; Secure; SameSite=Lax; Max-Age=0'
-        },
-        'body': json.dumps({'message': 'Logged out'}),
-        'isBase64Encoded': False
-    }
+    return json_response(200, {'message': 'Logged out'}, headers={
+        'X-Set-Cookie': 'auth_token=; Path=/; HttpOnly; Secure; SameSite=Lax; Max-Age=0'
+    })
+
+
+mark_imported(_import_started)
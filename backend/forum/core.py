@@ -0,0 +1,743 @@
+# Копия backend/_shared/core.py, создана tools/sync_shared.py. Не редактировать вручную.
+"""Общее ядро функций backend/: пул соединений, учёт запросов, ответы, кэши и принципал
+
+Каждая функция деплоится отдельной папкой, поэтому модуль копируется в неё как
+core.py командой python tools/sync_shared.py; правится только этот файл,
+tools/sync_shared.py --check падает, если копии разошлись с ним.
+"""
+import gzip
+import json
+import os
+import base64
+import threading
+import hashlib
+import importlib.util
+import sys
+import time
+import types
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+
+# PyJWT, psycopg2 и email.utils загружаются при первом обращении к ним: preflight и маршруты,
+# которым не нужны БД или токен, не платят за эти импорты на холодном старте.
+def lazy_import(name: str):
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def is_loaded(module) -> bool:
+    # LazyLoader подменяет класс модуля на обычный ModuleType после первой загрузки
+    return type(module) is types.ModuleType
+
+
+jwt = lazy_import('jwt')
+psycopg2 = lazy_import('psycopg2')
+email_utils = lazy_import('email.utils')
+LAZY_MODULES = {'jwt': jwt, 'psycopg2': psycopg2, 'email.utils': email_utils}
+
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '5'))
+DB_HEALTHCHECK_IDLE = float(os.environ.get('DB_HEALTHCHECK_IDLE', '30'))
+
+# Пул живёт на уровне модуля и переживает тёплые вызовы handler
+_pool = None
+_pool_lock = threading.Lock()
+_checked_out = {}
+_last_used = {}
+_pool_counters = {'checkouts': 0, 'healthchecks': 0, 'discarded': 0, 'pool_restarts': 0}
+
+
+def get_pool() -> 'psycopg2.pool.ThreadedConnectionPool':
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool_module = importlib.import_module('psycopg2.pool')
+                _pool = pool_module.ThreadedConnectionPool(
+                    DB_POOL_MIN, DB_POOL_MAX, os.environ['DATABASE_URL'], cursor_factory=get_cursor_class()
+                )
+    return _pool
+
+
+def reset_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool_counters['pool_restarts'] += 1
+        _pool = None
+        _checked_out.clear()
+        _last_used.clear()
+
+
+def is_conn_healthy(conn) -> bool:
+    if conn.closed:
+        return False
+    # Соединение, которое ещё не выдавалось, пул только что открыл: проверять его незачем
+    last_used = _last_used.get(id(conn))
+    if last_used is None or time.monotonic() - last_used < DB_HEALTHCHECK_IDLE:
+        return True
+    _pool_counters['healthchecks'] += 1
+    try:
+        cur = conn.cursor()
+        cur.execute('SELECT 1')
+        cur.close()
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def get_conn():
+    for _ in range(DB_POOL_MAX + 1):
+        try:
+            conn = get_pool().getconn()
+        except psycopg2.OperationalError:
+            reset_pool()
+            conn = get_pool().getconn()
+        if is_conn_healthy(conn):
+            _pool_counters['checkouts'] += 1
+            _checked_out[id(conn)] = conn
+            return conn
+        _pool_counters['discarded'] += 1
+        _last_used.pop(id(conn), None)
+        get_pool().putconn(conn, close=True)
+    raise psycopg2.OperationalError('No healthy database connection available')
+
+
+def release_conn(conn) -> None:
+    if _checked_out.pop(id(conn), None) is None:
+        return
+    broken = bool(conn.closed)
+    if not broken:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            broken = True
+    if broken:
+        _pool_counters['discarded'] += 1
+        _last_used.pop(id(conn), None)
+    else:
+        _last_used[id(conn)] = time.monotonic()
+    get_pool().putconn(conn, close=broken)
+
+
+def release_all_conns() -> None:
+    for conn in list(_checked_out.values()):
+        release_conn(conn)
+
+
+def pool_stats() -> dict:
+    idle = len(_pool._pool) if _pool is not None else 0
+    return {
+        'min_size': DB_POOL_MIN,
+        'max_size': DB_POOL_MAX,
+        'started': _pool is not None,
+        'idle': idle,
+        'in_use': len(_checked_out),
+        **_pool_counters
+    }
+
+
+# Учёт на один вызов handler: курсоры пула считают запросы, время в БД и строки,
+# dump_json — время сериализации. Итог уходит в заголовок Server-Timing и
+# в строку лога, по которой видно маршруты с запросом на каждую строку.
+# В ту же строку попадает состояние пула контейнера: занятые и свободные соединения,
+# выдачи, проверки и выброшенные соединения с момента старта, а также размер
+# тела до и после сжатия и сколько байт сжатие сэкономило контейнеру всего.
+REQUEST_LOG = os.environ.get('REQUEST_LOG', '1') == '1'
+
+_function = {'name': None}
+
+_request_stats = {
+    'queries': 0, 'db_ms': 0.0, 'rows': 0, 'serialize_ms': 0.0, 'bytes_raw': 0, 'bytes_sent': 0, 'encoding': None
+}
+_cursor_class = None
+
+
+def reset_request_stats() -> None:
+    _request_stats.update(queries=0, db_ms=0.0, rows=0, serialize_ms=0.0, bytes_raw=0, bytes_sent=0, encoding=None)
+
+
+def record_query(started: float, rowcount: int) -> None:
+    _request_stats['queries'] += 1
+    _request_stats['db_ms'] += (time.perf_counter() - started) * 1000
+    _request_stats['rows'] += max(rowcount, 0)
+
+
+def get_cursor_class():
+    # Класс строится при первом подключении, чтобы не тянуть psycopg2 на холодном старте
+    global _cursor_class
+    if _cursor_class is None:
+        extensions = importlib.import_module('psycopg2.extensions')
+        
+        class InstrumentedCursor(extensions.cursor):
+            def execute(self, query, vars=None):
+                started = time.perf_counter()
+                try:
+                    return super().execute(query, vars)
+                finally:
+                    record_query(started, self.rowcount)
+            
+            def executemany(self, query, vars_list):
+                started = time.perf_counter()
+                try:
+                    return super().executemany(query, vars_list)
+                finally:
+                    record_query(started, self.rowcount)
+            
+            def copy_expert(self, sql, file, size=8192):
+                started = time.perf_counter()
+                try:
+                    return super().copy_expert(sql, file, size)
+                finally:
+                    record_query(started, self.rowcount)
+        
+        _cursor_class = InstrumentedCursor
+    return _cursor_class
+
+
+def finish_request(event: dict, response: dict, started: float) -> dict:
+    total_ms = (time.perf_counter() - started) * 1000
+    stats = _request_stats
+    timing = (
+        f"db;dur={stats['db_ms']:.2f}, queries;desc=\"{stats['queries']}\", rows;desc=\"{stats['rows']}\", "
+        f"serialize;dur={stats['serialize_ms']:.2f}, total;dur={total_ms:.2f}"
+    )
+    if REQUEST_LOG:
+        ratio = round(stats['bytes_sent'] / stats['bytes_raw'], 3) if stats['bytes_raw'] else None
+        entry = {
+            'event': 'request',
+            'function': _function['name'],
+            'method': event.get('httpMethod'),
+            'path': (event.get('params') or {}).get('path', ''),
+            'status': response.get('statusCode'),
+            'queries': stats['queries'],
+            'db_ms': round(stats['db_ms'], 2),
+            'rows': stats['rows'],
+            'serialize_ms': round(stats['serialize_ms'], 2),
+            'total_ms': round(total_ms, 2),
+            'bytes_raw': stats['bytes_raw'],
+            'bytes_sent': stats['bytes_sent'],
+            'encoding': stats['encoding'],
+            'compression_ratio': ratio,
+            'pool': pool_stats(),
+            'responses': response_stats()
+        }
+        # Кэш ответов есть только у маршрутов с cached_read; у остальных счётчики нулевые
+        if _cache_counters['hits'] or _cache_counters['misses']:
+            entry['cache'] = cache_stats()
+        print(json.dumps(entry))
+    return {
+        **response,
+        'headers': {**response.get('headers', {}), 'Server-Timing': timing, 'Timing-Allow-Origin': '*'}
+    }
+
+
+# Кэш редко меняющихся ответов (фракции, роли, админы, профили): TTL + LRU
+# с ограничением по числу записей и байтам тела. Запись в любой инстанс
+# увеличивает поколение области в cache_generations, остальные тёплые
+# контейнеры сверяют поколения не чаще раза в CACHE_GENERATION_CHECK секунд.
+CACHE_TTL = float(os.environ.get('CACHE_TTL', '60'))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '512'))
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+CACHE_GENERATION_CHECK = float(os.environ.get('CACHE_GENERATION_CHECK', '2'))
+
+_cache = OrderedDict()
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+_cache_generations = {}
+_cache_generations_checked = 0.0
+_cache_counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+
+def drop_cache_entry(key: str) -> None:
+    global _cache_bytes
+    entry = _cache.pop(key, None)
+    if entry:
+        _cache_bytes -= entry[3]
+
+
+def invalidate_cache(scopes) -> None:
+    with _cache_lock:
+        for key in [key for key, entry in _cache.items() if entry[1] in scopes]:
+            drop_cache_entry(key)
+            _cache_counters['invalidations'] += 1
+
+
+def refresh_cache_generations() -> None:
+    global _cache_generations_checked
+    now = time.monotonic()
+    if now - _cache_generations_checked < CACHE_GENERATION_CHECK:
+        return
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("SELECT scope, generation FROM cache_generations")
+        generations = dict(cur.fetchall())
+        cur.close()
+        release_conn(conn)
+    except Exception:
+        with _cache_lock:
+            for key in list(_cache):
+                drop_cache_entry(key)
+        return
+    stale = [scope for scope, generation in generations.items() if _cache_generations.get(scope) != generation]
+    if stale:
+        invalidate_cache(stale)
+    _cache_generations.update(generations)
+    _cache_generations_checked = now
+
+
+def bump_cache_generation(cur, scopes) -> None:
+    cur.execute("""
+        INSERT INTO cache_generations (scope, generation)
+        SELECT unnest(%s::text[]), 1
+        ON CONFLICT (scope) DO UPDATE
+        SET generation = cache_generations.generation + 1, updated_at = CURRENT_TIMESTAMP
+    """, (list(scopes),))
+    invalidate_cache(scopes)
+    if 'principals' in scopes:
+        invalidate_principals()
+
+
+def cached_read(event: dict, scope: str, key: str, loader) -> dict:
+    global _cache_bytes
+    refresh_cache_generations()
+    now = time.monotonic()
+    
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry and entry[0] > now:
+            _cache.move_to_end(key)
+            _cache_counters['hits'] += 1
+            response = entry[2]
+            if 'ETag' in response['headers'] and is_not_modified(event, response['headers']):
+                return not_modified_response({
+                    name: value for name, value in response['headers'].items()
+                    if name in ('ETag', 'Last-Modified', 'Access-Control-Expose-Headers')
+                })
+            return {**response, 'headers': {**response['headers'], 'X-Cache': 'HIT'}}
+        if entry:
+            drop_cache_entry(key)
+        _cache_counters['misses'] += 1
+    
+    response = loader()
+    if response['statusCode'] != 200:
+        return response
+    
+    size = len(response['body'])
+    if size <= CACHE_MAX_BYTES:
+        with _cache_lock:
+            drop_cache_entry(key)
+            _cache[key] = (now + CACHE_TTL, scope, response, size)
+            _cache_bytes += size
+            while len(_cache) > CACHE_MAX_ENTRIES or _cache_bytes > CACHE_MAX_BYTES:
+                drop_cache_entry(next(iter(_cache)))
+                _cache_counters['evictions'] += 1
+    
+    return {**response, 'headers': {**response['headers'], 'X-Cache': 'MISS'}}
+
+
+def cache_stats() -> dict:
+    lookups = _cache_counters['hits'] + _cache_counters['misses']
+    return {
+        'entries': len(_cache),
+        'bytes': _cache_bytes,
+        'max_entries': CACHE_MAX_ENTRIES,
+        'max_bytes': CACHE_MAX_BYTES,
+        'hit_ratio': round(_cache_counters['hits'] / lookups, 3) if lookups else None,
+        **_cache_counters
+    }
+
+
+def get_header(event: dict, name: str) -> str:
+    lowered = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == lowered:
+            return value or ''
+    return ''
+
+
+# Ответы собираются в одном месте: быстрый JSON-кодировщик, если он установлен,
+# и сжатие крупных тел (состав фракции, длинный тред), если клиент его принимает.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+
+_response_counters = {'responses': 0, 'compressed': 0, 'bytes_raw': 0, 'bytes_sent': 0}
+
+
+def dump_json(payload) -> str:
+    started = time.perf_counter()
+    if orjson is not None:
+        body = orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    else:
+        body = json.dumps(payload)
+    _request_stats['serialize_ms'] += (time.perf_counter() - started) * 1000
+    return body
+
+
+def json_response(status: int, payload, headers: dict = None) -> dict:
+    return {
+        'statusCode': status,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **(headers or {})},
+        'body': dump_json(payload),
+        'isBase64Encoded': False
+    }
+
+
+def accepted_encodings(event: dict) -> set:
+    encodings = set()
+    for part in get_header(event, 'Accept-Encoding').split(','):
+        name, _, params = part.partition(';')
+        params = params.strip().lower()
+        if params.startswith('q='):
+            try:
+                if float(params[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if name.strip():
+            encodings.add(name.strip().lower())
+    return encodings
+
+
+def compress_response(event: dict, response: dict) -> dict:
+    body = response.get('body')
+    _response_counters['responses'] += 1
+    if not body or response.get('isBase64Encoded') or 'Content-Encoding' in response.get('headers', {}):
+        return response
+    
+    raw = body.encode('utf-8')
+    _response_counters['bytes_raw'] += len(raw)
+    _request_stats['bytes_raw'] = len(raw)
+    encodings = accepted_encodings(event) if len(raw) >= COMPRESS_MIN_BYTES else set()
+    
+    if brotli is not None and 'br' in encodings:
+        encoding, data = 'br', brotli.compress(raw, quality=5)
+    elif 'gzip' in encodings or '*' in encodings:
+        encoding, data = 'gzip', gzip.compress(raw, compresslevel=6, mtime=0)
+    else:
+        encoding, data = None, raw
+    
+    if encoding is None or len(data) >= len(raw):
+        _response_counters['bytes_sent'] += len(raw)
+        _request_stats['bytes_sent'] = len(raw)
+        return response
+    
+    _response_counters['compressed'] += 1
+    _response_counters['bytes_sent'] += len(data)
+    _request_stats.update(bytes_sent=len(data), encoding=encoding)
+    headers = {
+        **response['headers'],
+        'Content-Encoding': encoding,
+        'Vary': 'Accept-Encoding',
+        'X-Uncompressed-Length': str(len(raw))
+    }
+    # Сжатое тело байт в байт отличается от исходного, поэтому сильный ETag ослабляется
+    if headers.get('ETag') and not headers['ETag'].startswith('W/'):
+        headers['ETag'] = 'W/' + headers['ETag']
+    return {
+        **response,
+        'headers': headers,
+        'body': base64.b64encode(data).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+
+def response_stats() -> dict:
+    return {
+        **_response_counters,
+        'bytes_saved': _response_counters['bytes_raw'] - _response_counters['bytes_sent'],
+        'encoder': 'orjson' if orjson is not None else 'json'
+    }
+
+
+def make_etag(version, weak: bool = False) -> str:
+    digest = hashlib.sha1(repr(version).encode()).hexdigest()
+    return f'W/"{digest}"' if weak else f'"{digest}"'
+
+
+def validator_headers(etag: str, last_modified) -> dict:
+    headers = {'ETag': etag, 'Access-Control-Expose-Headers': 'ETag, Last-Modified'}
+    if last_modified:
+        last_modified = last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+        headers['Last-Modified'] = email_utils.format_datetime(last_modified, usegmt=True)
+    return headers
+
+
+def is_not_modified(event: dict, validators: dict) -> bool:
+    if_none_match = get_header(event, 'If-None-Match')
+    if if_none_match:
+        tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return '*' in tags or validators['ETag'].removeprefix('W/') in tags
+    
+    if_modified_since = get_header(event, 'If-Modified-Since')
+    if not if_modified_since or 'Last-Modified' not in validators:
+        return False
+    try:
+        since = email_utils.parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return email_utils.parsedate_to_datetime(validators['Last-Modified']) <= since
+
+
+def not_modified_response(validators: dict) -> dict:
+    return {
+        'statusCode': 304,
+        'headers': {'Access-Control-Allow-Origin': '*', **validators},
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+
+def conditional_read(event: dict, version_loader, loader) -> dict:
+    # Без валидатора (база недоступна, запрос упал) ответ строится как обычно:
+    # загрузчик сам вернёт 500 с текстом ошибки, если база так и не ответит
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        try:
+            version = version_loader(cur)
+        finally:
+            cur.close()
+            release_conn(conn)
+    except Exception:
+        version = None
+    
+    if version is None:
+        return loader()
+    
+    validators = validator_headers(*version)
+    if is_not_modified(event, validators):
+        return not_modified_response(validators)
+    
+    response = loader()
+    if response['statusCode'] == 200:
+        response['headers'].update(validators)
+    return response
+
+
+# Принципал (пользователь, админ-ранг, роль и санкции) кэшируется по хэшу токена.
+# Бан, мут или смена админ-статуса сдвигают поколение 'principals' в cache_generations,
+# и тёплые контейнеры всех функций сбрасывают кэш при следующей сверке.
+PRINCIPAL_TTL = float(os.environ.get('PRINCIPAL_TTL', '30'))
+PRINCIPAL_CACHE_MAX = int(os.environ.get('PRINCIPAL_CACHE_MAX', '1024'))
+PRINCIPAL_GENERATION_CHECK = float(os.environ.get('PRINCIPAL_GENERATION_CHECK', '2'))
+
+_principals = OrderedDict()
+_principals_lock = threading.Lock()
+_principals_generation = None
+_principals_checked = 0.0
+
+
+def get_token(event: dict) -> str:
+    return get_header(event, 'X-Authorization').replace('Bearer ', '')
+
+
+def invalidate_principals() -> None:
+    with _principals_lock:
+        _principals.clear()
+
+
+def sync_principal_generation(generation: int) -> bool:
+    global _principals_generation, _principals_checked
+    _principals_checked = time.monotonic()
+    if generation != _principals_generation:
+        invalidate_principals()
+        _principals_generation = generation
+        return True
+    return False
+
+
+def refresh_principal_generation() -> bool:
+    if time.monotonic() - _principals_checked < PRINCIPAL_GENERATION_CHECK:
+        return False
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT generation FROM cache_generations WHERE scope = 'principals'")
+    row = cur.fetchone()
+    cur.close()
+    release_conn(conn)
+    return sync_principal_generation(row[0] if row else 0)
+
+
+def load_principal(user_id: int):
+    now = datetime.utcnow()
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT u.id, u.username, u.nickname, u.avatar_url, u.is_owner, u.bio, u.status_text,
+               a.id, a.admin_rank, cr.name, cr.color,
+               EXISTS (
+                   SELECT 1 FROM bans b
+                   WHERE b.user_id = u.id AND b.is_active = TRUE
+                     AND (b.expires_at IS NULL OR b.expires_at > %s)
+               ),
+               EXISTS (
+                   SELECT 1 FROM mutes m
+                   WHERE m.user_id = u.id AND m.is_active = TRUE AND m.expires_at > %s
+               ),
+               COALESCE((SELECT generation FROM cache_generations WHERE scope = 'principals'), 0)
+        FROM users u
+        LEFT JOIN admins a ON u.id = a.user_id AND a.is_active = TRUE
+        LEFT JOIN custom_roles cr ON a.role_id = cr.id
+        WHERE u.id = %s
+    """, (now, now, user_id))
+    user = cur.fetchone()
+    cur.close()
+    release_conn(conn)
+    
+    if not user:
+        return None, None
+    
+    return {
+        'id': user[0],
+        'username': user[1],
+        'nickname': user[2],
+        'avatar_url': user[3],
+        'is_owner': user[4],
+        'is_admin': bool(user[7]),
+        'bio': user[5],
+        'status_text': user[6],
+        'admin_rank': user[8],
+        'role': {
+            'name': user[9],
+            'color': user[10]
+        } if user[9] else None,
+        'is_banned': user[11],
+        'is_muted': user[12]
+    }, user[13]
+
+
+def cached_principal(key: str, now: float):
+    with _principals_lock:
+        entry = _principals.get(key)
+        if not entry or entry[0] <= now:
+            return None
+        _principals.move_to_end(key)
+        return entry
+
+
+def resolve_principal(token: str):
+    key = hashlib.sha256(token.encode()).hexdigest()
+    now = time.monotonic()
+    
+    # Поколение сверяется только при попадании в кэш: промах и так читает принципала из БД.
+    entry = cached_principal(key, now)
+    if entry and not refresh_principal_generation():
+        if time.time() >= entry[1]:
+            raise jwt.ExpiredSignatureError('Signature has expired')
+        return entry[2]
+    
+    payload = jwt.decode(token, os.environ.get('JWT_SECRET', 'default_secret'), algorithms=['HS256'])
+    principal, generation = load_principal(payload['user_id'])
+    
+    if principal:
+        # Поколение читается тем же запросом, что и принципал: холодный контейнер
+        # сверяется сразу и не сбрасывает только что загруженную запись при первом попадании
+        sync_principal_generation(generation)
+        with _principals_lock:
+            _principals[key] = (now + PRINCIPAL_TTL, payload.get('exp', float('inf')), principal)
+            while len(_principals) > PRINCIPAL_CACHE_MAX:
+                _principals.popitem(last=False)
+    
+    return principal
+
+
+def preflight_response(methods: str, headers: str) -> dict:
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': methods,
+            'Access-Control-Allow-Headers': headers,
+            'Access-Control-Max-Age': '86400'
+        },
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+
+STARTUP_REPORT = os.environ.get('STARTUP_REPORT', '1') == '1'
+
+_startup = {'import_ms': None, 'reported': False}
+
+
+def mark_imported(import_started: float) -> None:
+    _startup['import_ms'] = round((time.perf_counter() - import_started) * 1000, 2)
+
+
+def report_startup(event: dict, started: float) -> None:
+    _startup['reported'] = True
+    if not STARTUP_REPORT:
+        return
+    print(json.dumps({
+        'event': 'cold_start',
+        'function': _function['name'],
+        'import_ms': _startup['import_ms'],
+        'first_request_ms': round((time.perf_counter() - started) * 1000, 2),
+        'method': event.get('httpMethod'),
+        'loaded': [name for name, module in LAZY_MODULES.items() if is_loaded(module)]
+    }))
+
+
+def serve(event: dict, function: str, route, preflight: dict, cleanup=None) -> dict:
+    # Общая обвязка handler: готовый preflight, учёт запроса, сжатие и возврат соединений в пул
+    started = time.perf_counter()
+    _function['name'] = function
+    if event.get('httpMethod') == 'OPTIONS':
+        response = preflight
+    else:
+        reset_request_stats()
+        try:
+            response = compress_response(event, route(event))
+        finally:
+            if cleanup is not None:
+                cleanup()
+            release_all_conns()
+        response = finish_request(event, response, started)
+    if not _startup['reported']:
+        report_startup(event, started)
+    return response
+
+
+# Курсоры keyset-пагинации: (created_at, id) последней строки страницы в base64url
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f'{created_at.isoformat()}|{row_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    padded = cursor + '=' * (-len(cursor) % 4)
+    created_at, row_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+    return datetime.fromisoformat(created_at), int(row_id)
+
+
+def parse_limit(value, default: int, maximum: int) -> int:
+    try:
+        limit = int(value) if value else default
+    except ValueError:
+        limit = default
+    return max(1, min(limit, maximum))
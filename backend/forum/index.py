@@ -1,26 +1,194 @@
 """Форум - создание постов и комментариев"""
+import time
+_import_started = time.perf_counter()
+
 import json
 import os
-import jwt
-import psycopg2
-from datetime import datetime
+import html
+import base64
+import threading
+from datetime import datetime, timedelta
+
+from core import (
+    conditional_read, decode_cursor, encode_cursor, get_conn, get_token, json_response, jwt,
+    make_etag, mark_imported, parse_limit, preflight_response, psycopg2, release_conn,
+    resolve_principal, serve
+)
+
+
+POSTS_PAGE_SIZE = 50
+POSTS_PAGE_MAX = 100
+COMMENTS_PAGE_SIZE = 50
+COMMENTS_PAGE_MAX = 200
+SEARCH_PAGE_SIZE = 20
+SEARCH_PAGE_MAX = 50
+SEARCH_TIMEOUT_MS = int(os.environ.get('SEARCH_TIMEOUT_MS', '500'))
+
+
+# Просмотры и лайки копятся в памяти тёплого контейнера и сбрасываются одной пачкой,
+# когда набралось COUNTER_FLUSH_THRESHOLD изменений или прошло COUNTER_FLUSH_INTERVAL секунд.
+# Сброс выполняется в конце вызова handler; при гибели контейнера теряется
+# не больше одной несброшенной пачки. Сами лайки при этом хранятся в post_likes сразу,
+# и backend/sweeper пересчитывает по ним forum_posts.likes.
+COUNTER_FLUSH_THRESHOLD = int(os.environ.get('COUNTER_FLUSH_THRESHOLD', '100'))
+COUNTER_FLUSH_INTERVAL = float(os.environ.get('COUNTER_FLUSH_INTERVAL', '10'))
+COUNTER_COLUMNS = ('views', 'likes')
+
+_pending_counters = {column: {} for column in COUNTER_COLUMNS}
+_pending_counters_total = 0
+_counters_lock = threading.Lock()
+_counters_last_flush = time.monotonic()
+
+
+def record_counter(column: str, post_id: int, delta: int = 1) -> int:
+    global _pending_counters_total
+    with _counters_lock:
+        pending = _pending_counters[column]
+        pending[post_id] = pending.get(post_id, 0) + delta
+        _pending_counters_total += abs(delta)
+        return pending[post_id]
+
+
+def pending_counter(column: str, post_id: int) -> int:
+    return _pending_counters[column].get(post_id, 0)
+
+
+def flush_counters(force: bool = False) -> int:
+    global _pending_counters, _pending_counters_total, _counters_last_flush
+    with _counters_lock:
+        due = (_pending_counters_total >= COUNTER_FLUSH_THRESHOLD
+               or time.monotonic() - _counters_last_flush >= COUNTER_FLUSH_INTERVAL)
+        if not _pending_counters_total or not (force or due):
+            return 0
+        batch = _pending_counters
+        _pending_counters = {column: {} for column in COUNTER_COLUMNS}
+        _pending_counters_total = 0
+        _counters_last_flush = time.monotonic()
+    
+    post_ids = sorted(set().union(*batch.values()))
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE forum_posts p
+            SET views = p.views + v.views, likes = p.likes + v.likes
+            FROM unnest(%s::int[], %s::int[], %s::int[]) AS v(id, views, likes)
+            WHERE p.id = v.id
+        """, (
+            post_ids,
+            [batch['views'].get(post_id, 0) for post_id in post_ids],
+            [batch['likes'].get(post_id, 0) for post_id in post_ids]
+        ))
+        conn.commit()
+        cur.close()
+        release_conn(conn)
+    except Exception as e:
+        # Пачка возвращается в буфер до следующего сброса; если контейнер погибнет раньше,
+        # лайки восстановит сверка в sweeper, просмотры будут потеряны
+        print(json.dumps({
+            'event': 'counter_flush_failed',
+            'function': 'forum',
+            'posts': len(post_ids),
+            'error': str(e)
+        }))
+        for column, pending in batch.items():
+            for post_id, delta in pending.items():
+                record_counter(column, post_id, delta)
+        return 0
+    return len(post_ids)
+
+
+# Активные баны и муты держатся в памяти контейнера: user_id -> {id записи: expires_at}.
+# Раз в SANCTIONS_REFRESH_INTERVAL секунд подтягиваются только строки, изменённые после
+# водяной отметки (с запасом SANCTIONS_WATERMARK_OVERLAP на расхождение часов и долгие транзакции).
+SANCTIONS_REFRESH_INTERVAL = float(os.environ.get('SANCTIONS_REFRESH_INTERVAL', '5'))
+SANCTIONS_WATERMARK_OVERLAP = timedelta(seconds=int(os.environ.get('SANCTIONS_WATERMARK_OVERLAP', '60')))
+SANCTION_TABLES = ('bans', 'mutes')
+
+_sanctions = {table: {} for table in SANCTION_TABLES}
+_sanctions_watermark = {table: None for table in SANCTION_TABLES}
+_sanctions_lock = threading.Lock()
+_sanctions_checked = 0.0
+
+
+def apply_sanction_rows(table: str, rows) -> None:
+    users = _sanctions[table]
+    for row_id, user_id, expires_at, is_active, updated_at in rows:
+        if is_active:
+            users.setdefault(user_id, {})[row_id] = expires_at
+        elif user_id in users:
+            users[user_id].pop(row_id, None)
+            if not users[user_id]:
+                del users[user_id]
+        watermark = _sanctions_watermark[table]
+        if updated_at and (watermark is None or updated_at > watermark):
+            _sanctions_watermark[table] = updated_at
+
+
+def refresh_sanctions() -> None:
+    global _sanctions_checked
+    now = time.monotonic()
+    if now - _sanctions_checked < SANCTIONS_REFRESH_INTERVAL:
+        return
+    
+    conn = get_conn()
+    cur = conn.cursor()
+    with _sanctions_lock:
+        for table in SANCTION_TABLES:
+            watermark = _sanctions_watermark[table]
+            if watermark is None:
+                cur.execute(f"""
+                    SELECT id, user_id, expires_at, is_active, updated_at
+                    FROM {table}
+                    WHERE is_active = TRUE
+                """)
+            else:
+                cur.execute(f"""
+                    SELECT id, user_id, expires_at, is_active, updated_at
+                    FROM {table}
+                    WHERE updated_at > %s
+                    ORDER BY updated_at
+                """, (watermark - SANCTIONS_WATERMARK_OVERLAP,))
+            apply_sanction_rows(table, cur.fetchall())
+            if _sanctions_watermark[table] is None:
+                _sanctions_watermark[table] = datetime.utcnow()
+        _sanctions_checked = now
+    cur.close()
+    release_conn(conn)
+
+
+def is_sanctioned(table: str, user_id: int) -> bool:
+    rows = _sanctions[table].get(user_id)
+    if not rows:
+        return False
+    now = datetime.utcnow()
+    return any(expires_at is None or expires_at > now for expires_at in rows.values())
+
+
+def sanction_response(user_id: int, check_mute: bool = True):
+    refresh_sanctions()
+    if is_sanctioned('bans', user_id):
+        error = 'User is banned'
+    elif check_mute and is_sanctioned('mutes', user_id):
+        error = 'User is muted'
+    else:
+        return None
+    return json_response(403, {'error': error})
+
+
+PREFLIGHT_RESPONSE = preflight_response(
+    'GET, POST, PUT, DELETE, OPTIONS',
+    'Content-Type, X-Authorization, If-None-Match, If-Modified-Since'
+)
+
 
 def handler(event: dict, context) -> dict:
+    return serve(event, 'forum', route, PREFLIGHT_RESPONSE, cleanup=flush_counters)
+
+
+def route(event: dict) -> dict:
     method = event.get('httpMethod', 'GET')
     
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Authorization',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
-    
     path = event.get('params', {}).get('path', '')
     
     if path == '/posts':
@@ -28,107 +196,135 @@ def handler(event: dict, context) -> dict:
             return get_posts(event)
         elif method == 'POST':
             return create_post(event)
+    elif path.startswith('/posts/') and path.endswith('/comments'):
+        post_id = path.split('/')[2]
+        if method == 'GET':
+            return get_comments(event, post_id)
     elif path.startswith('/posts/'):
         post_id = path.split('/')[-1]
         if method == 'GET':
-            return get_post(post_id)
+            return get_post_conditional(event, post_id)
         elif method == 'PUT':
             return update_post(event, post_id)
     elif path == '/comments':
         if method == 'POST':
             return add_comment(event)
+    elif path == '/search':
+        if method == 'GET':
+            return search_forum(event)
+    
+    return json_response(404, {'error': 'Not found'})
+
+
+def get_optional_user_id(event: dict):
+    token = get_token(event)
     
-    return {
-        'statusCode': 404,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Not found'}),
-        'isBase64Encoded': False
-    }
+    if not token:
+        return None
+    
+    try:
+        principal = resolve_principal(token)
+        return principal['id'] if principal else None
+    except (jwt.InvalidTokenError, KeyError):
+        return None
+
+
+def get_liked_post_ids(cur, user_id: int, post_ids: list) -> set:
+    if not user_id or not post_ids:
+        return set()
+    cur.execute(
+        "SELECT post_id FROM post_likes WHERE user_id = %s AND post_id = ANY(%s)",
+        (user_id, post_ids)
+    )
+    return {row[0] for row in cur.fetchall()}
 
 
 def get_posts(event: dict) -> dict:
     try:
-        category = event.get('queryStringParameters', {}).get('category')
+        query = event.get('queryStringParameters') or {}
+        category = query.get('category')
+        cursor = query.get('cursor')
+        limit = parse_limit(query.get('limit'), POSTS_PAGE_SIZE, POSTS_PAGE_MAX)
         
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
+        conditions = []
+        params = []
         
         if category:
-            cur.execute("""
-                SELECT p.id, p.title, p.content, p.category, p.views, p.likes, p.created_at,
-                       u.username, u.nickname, u.avatar_url
-                FROM forum_posts p
-                JOIN users u ON p.user_id = u.id
-                WHERE p.category = %s
-                ORDER BY p.created_at DESC
-                LIMIT 50
-            """, (category,))
-        else:
-            cur.execute("""
-                SELECT p.id, p.title, p.content, p.category, p.views, p.likes, p.created_at,
-                       u.username, u.nickname, u.avatar_url
-                FROM forum_posts p
-                JOIN users u ON p.user_id = u.id
-                ORDER BY p.created_at DESC
-                LIMIT 50
-            """)
+            conditions.append("p.category = %s")
+            params.append(category)
+        if cursor:
+            try:
+                cursor_created_at, cursor_id = decode_cursor(cursor)
+            except Exception:
+                return json_response(400, {'error': 'Invalid cursor'})
+            conditions.append("(p.created_at, p.id) < (%s, %s)")
+            params.extend([cursor_created_at, cursor_id])
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        params.append(limit + 1)
+        
+        conn = get_conn()
+        cur = conn.cursor()
+        
+        cur.execute(f"""
+            SELECT p.id, p.title, LEFT(p.content, 201), p.category, p.views, p.likes, p.created_at,
+                   u.username, u.nickname, u.avatar_url, p.comments_count
+            FROM forum_posts p
+            JOIN users u ON p.user_id = u.id
+            {where}
+            ORDER BY p.created_at DESC, p.id DESC
+            LIMIT %s
+        """, params)
+        
+        rows = cur.fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][6], rows[-1][0]) if has_more else None
+        liked = get_liked_post_ids(cur, get_optional_user_id(event), [row[0] for row in rows])
         
         posts = []
-        for row in cur.fetchall():
-            post_id = row[0]
-            
-            cur.execute("SELECT COUNT(*) FROM forum_comments WHERE post_id = %s", (post_id,))
-            comments_count = cur.fetchone()[0]
-            
+        for row in rows:
             posts.append({
                 'id': row[0],
                 'title': row[1],
                 'content': row[2][:200] + '...' if len(row[2]) > 200 else row[2],
                 'category': row[3],
-                'views': row[4],
-                'likes': row[5],
+                'views': row[4] + pending_counter('views', row[0]),
+                'likes': row[5] + pending_counter('likes', row[0]),
                 'created_at': row[6].isoformat() if row[6] else None,
                 'author': {
                     'username': row[7],
                     'nickname': row[8],
                     'avatar_url': row[9]
                 },
-                'comments_count': comments_count
+                'comments_count': row[10],
+                'liked_by_me': row[0] in liked
             })
         
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'posts': posts}),
-            'isBase64Encoded': False
-        }
+        release_conn(conn)
+        
+        return json_response(200, {'posts': posts, 'next_cursor': next_cursor})
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
 
 
 def create_post(event: dict) -> dict:
     try:
-        auth_header = event.get('headers', {}).get('X-Authorization', '')
-        token = auth_header.replace('Bearer ', '')
+        token = get_token(event)
         
         if not token:
-            return {
-                'statusCode': 401,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'No token provided'}),
-                'isBase64Encoded': False
-            }
+            return json_response(401, {'error': 'No token provided'})
+        
+        principal = resolve_principal(token)
         
-        payload = jwt.decode(token, os.environ.get('JWT_SECRET', 'default_secret'), algorithms=['HS256'])
-        user_id = payload['user_id']
+        if not principal:
+            return json_response(401, {'error': 'User not found'})
+        
+        user_id = principal['id']
+        sanctioned = sanction_response(user_id)
+        if sanctioned:
+            return sanctioned
         
         body = json.loads(event.get('body', '{}'))
         title = body.get('title')
@@ -136,14 +332,9 @@ def create_post(event: dict) -> dict:
         category = body.get('category', 'general')
         
         if not title or not content:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'title and content required'}),
-                'isBase64Encoded': False
-            }
+            return json_response(400, {'error': 'title and content required'})
         
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_conn()
         cur = conn.cursor()
         
         cur.execute("""
@@ -156,41 +347,49 @@ def create_post(event: dict) -> dict:
         conn.commit()
         
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 201,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'message': 'Post created', 'post_id': post_id}),
-            'isBase64Encoded': False
-        }
+        release_conn(conn)
+        
+        return json_response(201, {'message': 'Post created', 'post_id': post_id})
     except jwt.ExpiredSignatureError:
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Token expired'}),
-            'isBase64Encoded': False
-        }
+        return json_response(401, {'error': 'Token expired'})
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
+
+
+def get_post_version(cur, post_id: str):
+    cur.execute("""
+        SELECT p.updated_at, p.likes, p.comments_count, u.updated_at,
+               (SELECT MAX(id) FROM forum_comments WHERE post_id = p.id),
+               GREATEST(p.updated_at, u.updated_at,
+                        (SELECT MAX(created_at) FROM forum_comments WHERE post_id = p.id))
+        FROM forum_posts p
+        JOIN users u ON p.user_id = u.id
+        WHERE p.id = %s
+    """, (post_id,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    # Лайки этого контейнера, ещё не сброшенные в forum_posts, тоже меняют тело ответа.
+    # Просмотры в версию не входят: иначе каждый GET сбивал бы собственный ETag.
+    likes = row[1] + pending_counter('likes', int(post_id))
+    return make_etag((row[0], likes) + row[2:5], weak=True), row[5]
+
+
+def get_post_conditional(event: dict, post_id: str) -> dict:
+    response = conditional_read(event, lambda cur: get_post_version(cur, post_id), lambda: get_post(post_id))
+    if response['statusCode'] == 304:
+        record_counter('views', int(post_id))
+    return response
 
 
 def get_post(post_id: str) -> dict:
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_conn()
         cur = conn.cursor()
         
-        cur.execute("UPDATE forum_posts SET views = views + 1 WHERE id = %s", (post_id,))
-        conn.commit()
-        
         cur.execute("""
             SELECT p.id, p.title, p.content, p.category, p.views, p.likes, p.created_at,
-                   u.username, u.nickname, u.avatar_url
+                   u.username, u.nickname, u.avatar_url, p.comments_count
             FROM forum_posts p
             JOIN users u ON p.user_id = u.id
             WHERE p.id = %s
@@ -200,97 +399,127 @@ def get_post(post_id: str) -> dict:
         
         if not post:
             cur.close()
-            conn.close()
-            return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Post not found'}),
-                'isBase64Encoded': False
+            release_conn(conn)
+            return json_response(404, {'error': 'Post not found'})
+        
+        pending_views = record_counter('views', post[0])
+        
+        comments, comments_next_cursor = fetch_comments_page(cur, post[0], None, COMMENTS_PAGE_SIZE)
+        
+        cur.close()
+        release_conn(conn)
+        
+        return json_response(200, {
+            'id': post[0],
+            'title': post[1],
+            'content': post[2],
+            'category': post[3],
+            'views': post[4] + pending_views,
+            'likes': post[5] + pending_counter('likes', post[0]),
+            'created_at': post[6].isoformat() if post[6] else None,
+            'author': {
+                'username': post[7],
+                'nickname': post[8],
+                'avatar_url': post[9]
+            },
+            'comments': comments,
+            'comments_count': post[10],
+            'comments_next_cursor': comments_next_cursor
+        })
+    except Exception as e:
+        return json_response(500, {'error': str(e)})
+
+
+def fetch_comments_page(cur, post_id: int, after, limit: int) -> tuple:
+    conditions = ["c.post_id = %s"]
+    params = [post_id]
+    
+    if after:
+        conditions.append("(c.created_at, c.id) > (%s, %s)")
+        params.extend(after)
+    params.append(limit + 1)
+    
+    cur.execute(f"""
+        SELECT c.id, c.content, c.created_at,
+               u.username, u.nickname, u.avatar_url
+        FROM forum_comments c
+        JOIN users u ON c.user_id = u.id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY c.created_at ASC, c.id ASC
+        LIMIT %s
+    """, params)
+    
+    rows = cur.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1][2], rows[-1][0]) if has_more else None
+    
+    comments = []
+    for row in rows:
+        comments.append({
+            'id': row[0],
+            'content': row[1],
+            'created_at': row[2].isoformat() if row[2] else None,
+            'author': {
+                'username': row[3],
+                'nickname': row[4],
+                'avatar_url': row[5]
             }
+        })
+    
+    return comments, next_cursor
+
+
+def get_comments(event: dict, post_id: str) -> dict:
+    try:
+        query = event.get('queryStringParameters') or {}
+        limit = parse_limit(query.get('limit'), COMMENTS_PAGE_SIZE, COMMENTS_PAGE_MAX)
+        after = None
         
-        cur.execute("""
-            SELECT c.id, c.content, c.created_at,
-                   u.username, u.nickname, u.avatar_url
-            FROM forum_comments c
-            JOIN users u ON c.user_id = u.id
-            WHERE c.post_id = %s
-            ORDER BY c.created_at ASC
-        """, (post_id,))
+        if query.get('after'):
+            try:
+                after = decode_cursor(query['after'])
+            except Exception:
+                return json_response(400, {'error': 'Invalid cursor'})
         
-        comments = []
-        for row in cur.fetchall():
-            comments.append({
-                'id': row[0],
-                'content': row[1],
-                'created_at': row[2].isoformat() if row[2] else None,
-                'author': {
-                    'username': row[3],
-                    'nickname': row[4],
-                    'avatar_url': row[5]
-                }
-            })
+        conn = get_conn()
+        cur = conn.cursor()
+        
+        comments, next_cursor = fetch_comments_page(cur, post_id, after, limit)
         
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
-                'id': post[0],
-                'title': post[1],
-                'content': post[2],
-                'category': post[3],
-                'views': post[4],
-                'likes': post[5],
-                'created_at': post[6].isoformat() if post[6] else None,
-                'author': {
-                    'username': post[7],
-                    'nickname': post[8],
-                    'avatar_url': post[9]
-                },
-                'comments': comments
-            }),
-            'isBase64Encoded': False
-        }
+        release_conn(conn)
+        
+        return json_response(200, {'comments': comments, 'next_cursor': next_cursor})
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
 
 
 def add_comment(event: dict) -> dict:
     try:
-        auth_header = event.get('headers', {}).get('X-Authorization', '')
-        token = auth_header.replace('Bearer ', '')
+        token = get_token(event)
         
         if not token:
-            return {
-                'statusCode': 401,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'No token provided'}),
-                'isBase64Encoded': False
-            }
+            return json_response(401, {'error': 'No token provided'})
+        
+        principal = resolve_principal(token)
+        
+        if not principal:
+            return json_response(401, {'error': 'User not found'})
         
-        payload = jwt.decode(token, os.environ.get('JWT_SECRET', 'default_secret'), algorithms=['HS256'])
-        user_id = payload['user_id']
+        user_id = principal['id']
+        sanctioned = sanction_response(user_id)
+        if sanctioned:
+            return sanctioned
         
         body = json.loads(event.get('body', '{}'))
         post_id = body.get('post_id')
         content = body.get('content')
         
         if not post_id or not content:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'post_id and content required'}),
-                'isBase64Encoded': False
-            }
+            return json_response(400, {'error': 'post_id and content required'})
         
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_conn()
         cur = conn.cursor()
         
         cur.execute("""
@@ -300,85 +529,191 @@ def add_comment(event: dict) -> dict:
         """, (post_id, user_id, content, datetime.utcnow()))
         
         comment_id = cur.fetchone()[0]
+        
+        cur.execute("UPDATE forum_posts SET comments_count = comments_count + 1 WHERE id = %s", (post_id,))
         conn.commit()
         
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 201,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'message': 'Comment added', 'comment_id': comment_id}),
-            'isBase64Encoded': False
-        }
+        release_conn(conn)
+        
+        return json_response(201, {'message': 'Comment added', 'comment_id': comment_id})
     except jwt.ExpiredSignatureError:
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Token expired'}),
-            'isBase64Encoded': False
-        }
+        return json_response(401, {'error': 'Token expired'})
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
 
 
 def update_post(event: dict, post_id: str) -> dict:
     try:
-        auth_header = event.get('headers', {}).get('X-Authorization', '')
-        token = auth_header.replace('Bearer ', '')
+        token = get_token(event)
         
         if not token:
-            return {
-                'statusCode': 401,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'No token provided'}),
-                'isBase64Encoded': False
-            }
+            return json_response(401, {'error': 'No token provided'})
         
-        payload = jwt.decode(token, os.environ.get('JWT_SECRET', 'default_secret'), algorithms=['HS256'])
-        user_id = payload['user_id']
+        principal = resolve_principal(token)
+        
+        if not principal:
+            return json_response(401, {'error': 'User not found'})
+        
+        user_id = principal['id']
+        sanctioned = sanction_response(user_id, check_mute=False)
+        if sanctioned:
+            return sanctioned
         
         body = json.loads(event.get('body', '{}'))
         action = body.get('action')
         
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_conn()
         cur = conn.cursor()
         
-        cur.execute("SELECT user_id FROM forum_posts WHERE id = %s", (post_id,))
+        cur.execute("SELECT id, likes FROM forum_posts WHERE id = %s", (post_id,))
         post = cur.fetchone()
         
         if not post:
             cur.close()
-            conn.close()
-            return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Post not found'}),
-                'isBase64Encoded': False
-            }
+            release_conn(conn)
+            return json_response(404, {'error': 'Post not found'})
+        
+        post_id = post[0]
+        delta = 0
         
         if action == 'like':
-            cur.execute("UPDATE forum_posts SET likes = likes + 1 WHERE id = %s", (post_id,))
+            cur.execute("""
+                INSERT INTO post_likes (post_id, user_id, created_at)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (post_id, user_id) DO NOTHING
+            """, (post_id, user_id, datetime.utcnow()))
+            delta = cur.rowcount
             conn.commit()
+        elif action == 'unlike':
+            cur.execute("DELETE FROM post_likes WHERE post_id = %s AND user_id = %s", (post_id, user_id))
+            delta = -cur.rowcount
+            conn.commit()
+        
+        if delta:
+            record_counter('likes', post_id, delta)
+        
+        if action in ('like', 'unlike'):
+            liked = action == 'like'
+        else:
+            liked = bool(get_liked_post_ids(cur, user_id, [post_id]))
+        
+        cur.close()
+        release_conn(conn)
+        
+        return json_response(200, {
+            'message': 'Post updated',
+            'liked': liked,
+            'likes': post[1] + pending_counter('likes', post_id)
+        })
+    except Exception as e:
+        return json_response(500, {'error': str(e)})
+
+
+def encode_search_cursor(rank: float, kind: str, row_id: int) -> str:
+    raw = f'{rank!r}|{kind}|{row_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_search_cursor(cursor: str) -> tuple:
+    padded = cursor + '=' * (-len(cursor) % 4)
+    rank, kind, row_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+    return float(rank), kind, int(row_id)
+
+
+def render_snippet(snippet: str) -> str:
+    return html.escape(snippet or '').replace('\x02', '<mark>').replace('\x03', '</mark>')
+
+
+def search_forum(event: dict) -> dict:
+    try:
+        query = event.get('queryStringParameters') or {}
+        text = query.get('q', '').strip()
+        cursor = query.get('cursor')
+        limit = parse_limit(query.get('limit'), SEARCH_PAGE_SIZE, SEARCH_PAGE_MAX)
+        
+        if not text:
+            return json_response(400, {'error': 'q required'})
+        
+        params = {'q': text, 'limit': limit + 1}
+        after = ''
+        if cursor:
+            try:
+                params['rank'], params['kind'], params['id'] = decode_search_cursor(cursor)
+            except Exception:
+                return json_response(400, {'error': 'Invalid cursor'})
+            after = "WHERE (rank, kind, id) < (%(rank)s, %(kind)s, %(id)s)"
+        
+        conn = get_conn()
+        cur = conn.cursor()
+        
+        cur.execute(f"SET LOCAL statement_timeout = {SEARCH_TIMEOUT_MS}")
+        cur.execute(f"""
+            WITH q AS (
+                SELECT websearch_to_tsquery('russian', %(q)s) AS query
+            ),
+            hits AS (
+                -- Запрос подставлен константой, а не берётся из q: так планировщик видит сам
+                -- tsquery, оценивает по нему селективность и идёт по GIN-индексу, а не
+                -- перебирает таблицу в Nested Loop с CTE Scan
+                SELECT kind, id, post_id, user_id, rank, created_at
+                FROM (
+                    SELECT 'post' AS kind, p.id, p.id AS post_id, p.user_id, p.created_at,
+                           ts_rank(p.search_vector, websearch_to_tsquery('russian', %(q)s))::float8 AS rank
+                    FROM forum_posts p
+                    WHERE p.search_vector @@ websearch_to_tsquery('russian', %(q)s)
+                    UNION ALL
+                    SELECT 'comment' AS kind, c.id, c.post_id, c.user_id, c.created_at,
+                           ts_rank(c.search_vector, websearch_to_tsquery('russian', %(q)s))::float8 AS rank
+                    FROM forum_comments c
+                    WHERE c.search_vector @@ websearch_to_tsquery('russian', %(q)s)
+                ) matched
+                {after}
+                ORDER BY rank DESC, kind DESC, id DESC
+                LIMIT %(limit)s
+            )
+            SELECT h.kind, h.id, h.post_id, h.rank, h.created_at, p.title,
+                   ts_headline('russian', CASE WHEN h.kind = 'post' THEN p.content ELSE c.content END, q.query,
+                               'StartSel=' || chr(2) || ', StopSel=' || chr(3) || ', MaxWords=35, MinWords=15'),
+                   u.username, u.nickname, u.avatar_url
+            FROM hits h
+            CROSS JOIN q
+            JOIN forum_posts p ON p.id = h.post_id
+            LEFT JOIN forum_comments c ON h.kind = 'comment' AND c.id = h.id
+            JOIN users u ON u.id = h.user_id
+            ORDER BY h.rank DESC, h.kind DESC, h.id DESC
+        """, params)
+        
+        rows = cur.fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = encode_search_cursor(rows[-1][3], rows[-1][0], rows[-1][1]) if has_more else None
+        
+        results = []
+        for row in rows:
+            results.append({
+                'type': row[0],
+                'id': row[1],
+                'post_id': row[2],
+                'rank': row[3],
+                'created_at': row[4].isoformat() if row[4] else None,
+                'title': row[5],
+                'snippet': render_snippet(row[6]),
+                'author': {
+                    'username': row[7],
+                    'nickname': row[8],
+                    'avatar_url': row[9]
+                }
+            })
         
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'message': 'Post updated'}),
-            'isBase64Encoded': False
-        }
+        release_conn(conn)
+        
+        return json_response(200, {'results': results, 'next_cursor': next_cursor})
+    except psycopg2.errors.QueryCanceled:
+        return json_response(503, {'error': 'Search timed out, refine the query'})
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': str(e)})
+
+
+mark_imported(_import_started)
@@ -0,0 +1,171 @@
+"""Плановая очистка истёкших банов и мутов и сверка счётчиков лайков"""
+import hmac
+import json
+import os
+import time
+import psycopg2
+from datetime import datetime, timedelta
+
+# Функция не публичная: планировщик передаёт общий секрет в X-Sweeper-Secret.
+# Без настроенного SWEEPER_SECRET любой вызов отклоняется.
+SWEEPER_SECRET = os.environ.get('SWEEPER_SECRET', '')
+
+SWEEP_BATCH_SIZE = int(os.environ.get('SWEEP_BATCH_SIZE', '500'))
+SWEEP_MAX_BATCHES = int(os.environ.get('SWEEP_MAX_BATCHES', '20'))
+SWEEP_TIME_BUDGET = float(os.environ.get('SWEEP_TIME_BUDGET', '20'))
+
+# Форум копит дельты лайков в памяти контейнера; если контейнер погиб или сброс не удался,
+# forum_posts.likes расходится с post_likes. Каждый запуск пересчитывает лайки у постов,
+# которые лайкали за LIKES_RECONCILE_WINDOW, и у одной из LIKES_RECONCILE_SLICES долей всех
+# постов (диапазон id), так что за LIKES_RECONCILE_SLICES запусков (по умолчанию — сутки)
+# проверяются все посты — это ловит и потерянные снятия лайков, после которых в post_likes
+# не остаётся следа.
+# Дельта, которую живой контейнер сбросит уже после сверки, снова сдвинет счётчик, но пост
+# остаётся в окне или попадёт в свою долю, и следующий запуск его выправит.
+SWEEP_INTERVAL = int(os.environ.get('SWEEP_INTERVAL', '300'))
+LIKES_RECONCILE_WINDOW = timedelta(seconds=int(os.environ.get('LIKES_RECONCILE_WINDOW', '3600')))
+LIKES_RECONCILE_SLICES = int(os.environ.get('LIKES_RECONCILE_SLICES', '288'))
+
+# Таблица санкций -> тип записи в admin_logs
+SANCTIONS = {
+    'bans': 'BAN_EXPIRED',
+    'mutes': 'MUTE_EXPIRED'
+}
+
+
+def handler(event: dict, context) -> dict:
+    if event.get('httpMethod') == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Sweeper-Secret',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    if not is_authorized(event):
+        return {
+            'statusCode': 403,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Forbidden'}),
+            'isBase64Encoded': False
+        }
+    
+    try:
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        cur = conn.cursor()
+        
+        started = time.monotonic()
+        expired = {table: 0 for table in SANCTIONS}
+        
+        for table, action_type in SANCTIONS.items():
+            for _ in range(SWEEP_MAX_BATCHES):
+                count = sweep_batch(cur, table, action_type)
+                conn.commit()
+                expired[table] += count
+                if count < SWEEP_BATCH_SIZE or time.monotonic() - started > SWEEP_TIME_BUDGET:
+                    break
+        
+        likes_reconciled = reconcile_likes(cur)
+        conn.commit()
+        
+        if any(expired.values()):
+            cur.execute("""
+                INSERT INTO cache_generations (scope, generation)
+                VALUES ('principals', 1)
+                ON CONFLICT (scope) DO UPDATE SET generation = cache_generations.generation + 1
+            """)
+            conn.commit()
+        
+        cur.close()
+        conn.close()
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({
+                'message': 'Sweep complete',
+                'bans_expired': expired['bans'],
+                'mutes_expired': expired['mutes'],
+                'likes_reconciled': likes_reconciled,
+                'duration_ms': round((time.monotonic() - started) * 1000)
+            }),
+            'isBase64Encoded': False
+        }
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+
+
+def is_authorized(event: dict) -> bool:
+    provided = ''
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == 'x-sweeper-secret':
+            provided = value or ''
+    return bool(SWEEPER_SECRET) and hmac.compare_digest(provided.encode(), SWEEPER_SECRET.encode())
+
+
+def sweep_batch(cur, table: str, action_type: str) -> int:
+    now = datetime.utcnow()
+    cur.execute(f"""
+        WITH expired AS (
+            SELECT id
+            FROM {table}
+            WHERE is_active = TRUE AND expires_at <= %s
+            ORDER BY expires_at
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        ),
+        deactivated AS (
+            UPDATE {table} s
+            SET is_active = FALSE, updated_at = %s
+            FROM expired e
+            WHERE s.id = e.id
+            RETURNING s.id, s.user_id, s.expires_at
+        ),
+        logged AS (
+            INSERT INTO admin_logs (admin_id, action_type, target_user_id, details, created_at)
+            SELECT NULL, %s, user_id, 'Expired at ' || expires_at, %s
+            FROM deactivated
+        )
+        SELECT COUNT(*) FROM deactivated
+    """, (now, SWEEP_BATCH_SIZE, now, action_type, now))
+    return cur.fetchone()[0]
+
+
+def reconcile_likes(cur) -> int:
+    now = datetime.utcnow()
+    slice_no = int(time.time() // SWEEP_INTERVAL) % LIKES_RECONCILE_SLICES
+    # Границы доли считаются заранее и идут в запрос константами: по ним планировщик
+    # оценивает размер доли и обновляет посты по ключу, а не перебирает всю таблицу
+    cur.execute("SELECT COALESCE(MAX(id), 0) FROM forum_posts")
+    max_id = cur.fetchone()[0]
+    cur.execute("""
+        WITH touched AS (
+            SELECT post_id AS id FROM post_likes WHERE created_at >= %s
+            UNION
+            SELECT id FROM forum_posts WHERE id > %s AND id <= %s
+        ),
+        actual AS (
+            SELECT t.id, (SELECT COUNT(*) FROM post_likes l WHERE l.post_id = t.id) AS likes
+            FROM touched t
+        ),
+        fixed AS (
+            UPDATE forum_posts p
+            SET likes = a.likes
+            FROM actual a
+            WHERE p.id = a.id AND p.likes IS DISTINCT FROM a.likes
+            RETURNING p.id
+        )
+        SELECT COUNT(*) FROM fixed
+    """, (now - LIKES_RECONCILE_WINDOW, max_id * slice_no // LIKES_RECONCILE_SLICES,
+          max_id * (slice_no + 1) // LIKES_RECONCILE_SLICES))
+    return cur.fetchone()[0]
@@ -0,0 +1,11 @@
+-- Денормализованный счётчик комментариев для ленты форума
+ALTER TABLE forum_posts ADD COLUMN IF NOT EXISTS comments_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE forum_posts p
+SET comments_count = c.cnt
+FROM (
+    SELECT post_id, COUNT(*) AS cnt
+    FROM forum_comments
+    GROUP BY post_id
+) c
+WHERE c.post_id = p.id;
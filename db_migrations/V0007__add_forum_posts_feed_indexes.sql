@@ -0,0 +1,3 @@
+-- Индексы для keyset-пагинации ленты форума (created_at, id)
+CREATE INDEX IF NOT EXISTS idx_forum_posts_feed ON forum_posts(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_forum_posts_category_feed ON forum_posts(category, created_at DESC, id DESC);
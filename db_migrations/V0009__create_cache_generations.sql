@@ -0,0 +1,12 @@
+-- Поколения кэша: запись увеличивает поколение области, тёплые контейнеры сбрасывают свой кэш
+CREATE TABLE IF NOT EXISTS cache_generations (
+    scope VARCHAR(50) PRIMARY KEY,
+    generation BIGINT NOT NULL DEFAULT 1
+);
+
+INSERT INTO cache_generations (scope, generation) VALUES
+('factions', 1),
+('roles', 1),
+('admins', 1),
+('profiles', 1)
+ON CONFLICT (scope) DO NOTHING;
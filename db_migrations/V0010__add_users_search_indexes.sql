@@ -0,0 +1,9 @@
+-- Триграммный поиск пользователей в админке
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_users_username_trgm ON users USING GIN (username gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_users_nickname_trgm ON users USING GIN (nickname gin_trgm_ops);
+
+-- Быстрый путь для поиска по префиксу (в том числе для запросов короче трёх символов)
+CREATE INDEX IF NOT EXISTS idx_users_username_prefix ON users (lower(username) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_users_nickname_prefix ON users (lower(nickname) text_pattern_ops);
@@ -0,0 +1,15 @@
+-- Полнотекстовый поиск по форуму. Конфигурация russian стеммит кириллицу русским
+-- Snowball-стеммером, а латиницу английским, поэтому покрывает оба языка
+ALTER TABLE forum_posts ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('russian'::regconfig, coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('russian'::regconfig, coalesce(content, '')), 'B')
+    ) STORED;
+
+ALTER TABLE forum_comments ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        to_tsvector('russian'::regconfig, coalesce(content, ''))
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_forum_posts_search ON forum_posts USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_forum_comments_search ON forum_comments USING GIN (search_vector);
@@ -0,0 +1,2 @@
+-- Постраничная загрузка комментариев треда по (created_at, id)
+CREATE INDEX IF NOT EXISTS idx_forum_comments_thread ON forum_comments(post_id, created_at, id);
@@ -0,0 +1,5 @@
+-- Индексы для фильтров и keyset-пагинации журнала действий админов
+CREATE INDEX IF NOT EXISTS idx_admin_logs_created ON admin_logs(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_admin_logs_admin_created ON admin_logs(admin_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_admin_logs_target_created ON admin_logs(target_user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_admin_logs_action_created ON admin_logs(action_type, created_at, id);
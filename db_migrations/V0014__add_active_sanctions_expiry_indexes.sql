@@ -0,0 +1,3 @@
+-- Частичные индексы для плановой очистки истёкших санкций
+CREATE INDEX IF NOT EXISTS idx_bans_active_expires ON bans(expires_at) WHERE is_active = TRUE;
+CREATE INDEX IF NOT EXISTS idx_mutes_active_expires ON mutes(expires_at) WHERE is_active = TRUE;
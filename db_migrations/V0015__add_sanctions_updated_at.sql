@@ -0,0 +1,6 @@
+-- Отметка изменения санкций: форум подтягивает только изменения с последней сверки
+ALTER TABLE bans ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE mutes ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+CREATE INDEX IF NOT EXISTS idx_bans_updated ON bans(updated_at);
+CREATE INDEX IF NOT EXISTS idx_mutes_updated ON mutes(updated_at);
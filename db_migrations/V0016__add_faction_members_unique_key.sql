@@ -0,0 +1,46 @@
+-- Уникальный ключ участника фракции без блокировки записи (как и V0017, каждый
+-- оператор идёт отдельной командой вне транзакции).
+--
+-- Сначала убираем дубликаты, оставляя самую раннюю запись. Удаление идёт пачками
+-- по диапазонам id с COMMIT после каждой, чтобы не держать блокировки строк и
+-- не раздувать одну транзакцию на большой таблице; дубль ищется через
+-- idx_faction_members_user (V0002).
+CREATE OR REPLACE PROCEDURE dedupe_faction_members(batch_size INTEGER DEFAULT 10000)
+LANGUAGE plpgsql AS $$
+DECLARE
+    last_id INTEGER := 0;
+    max_id INTEGER;
+BEGIN
+    SELECT COALESCE(MAX(id), 0) INTO max_id FROM faction_members;
+    WHILE last_id < max_id LOOP
+        DELETE FROM faction_members a
+        WHERE a.id > last_id AND a.id <= last_id + batch_size
+          AND EXISTS (
+              SELECT 1 FROM faction_members b
+              WHERE b.user_id = a.user_id AND b.faction_id = a.faction_id AND b.id < a.id
+          );
+        last_id := last_id + batch_size;
+        COMMIT;
+    END LOOP;
+END;
+$$;
+
+CALL dedupe_faction_members();
+
+DROP PROCEDURE dedupe_faction_members(INTEGER);
+
+-- Индекс строится CONCURRENTLY. Если между чисткой и построением появился новый
+-- дубль, построение оборвётся и оставит INVALID-индекс: его нужно удалить
+-- (tools/index_usage.py показывает такие) и прогнать миграцию заново.
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_faction_members_user_faction ON faction_members(user_id, faction_id);
+
+-- Готовый индекс становится ограничением без повторного сканирования таблицы;
+-- ON CONFLICT (user_id, faction_id) в импорте состава опирается на него
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'idx_faction_members_user_faction') THEN
+        ALTER TABLE faction_members
+            ADD CONSTRAINT idx_faction_members_user_faction UNIQUE USING INDEX idx_faction_members_user_faction;
+    END IF;
+END;
+$$;
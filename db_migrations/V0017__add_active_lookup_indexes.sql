@@ -0,0 +1,28 @@
+-- Индексы под горячие выборки: активные бан и мут пользователя (login, /me,
+-- get_profile, список пользователей), новые пользователи для списка в админке
+-- и состав фракции.
+-- Строятся CONCURRENTLY, чтобы не блокировать запись; такие операторы нельзя
+-- выполнять внутри транзакции, поэтому каждый идёт отдельной командой.
+-- Если построение оборвалось, остаётся INVALID-индекс, который IF NOT EXISTS
+-- пропустит: его нужно удалить (tools/index_usage.py показывает такие) и
+-- прогнать миграцию заново.
+--
+-- forum_posts(created_at) и admin_logs(created_at) уже покрыты
+-- idx_forum_posts_feed (V0007) и idx_admin_logs_created (V0013), а уникальный
+-- ключ faction_members(user_id, faction_id) добавлен в V0016. Индекс по активным
+-- админам не нужен: в admins десятки строк, и планировщик читает её целиком.
+-- Замеры до и после — в tools/plan_benchmarks.json (метка V0017).
+
+-- expires_at в ключе позволяет проверять EXISTS по активной санкции без чтения таблицы
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_bans_active_user ON bans(user_id, expires_at) WHERE is_active = TRUE;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_mutes_active_user ON mutes(user_id, expires_at) WHERE is_active = TRUE;
+
+-- Список пользователей в админке без поиска: последние 50 по created_at
+-- читаются обратным проходом индекса вместо сортировки всей таблицы
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_created ON users(created_at);
+
+-- Порядок ключа совпадает с сортировкой состава фракции (генералы первыми, затем по дате вступления)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_faction_members_faction_general ON faction_members(faction_id, is_general DESC, joined_at);
+
+-- Новый индекс начинается с faction_id, одиночный индекс из V0002 стал лишним
+DROP INDEX CONCURRENTLY IF EXISTS idx_faction_members_faction;
@@ -0,0 +1,2 @@
+-- Время последнего сдвига поколения: Last-Modified для ответов, чей ETag строится по поколению области
+ALTER TABLE cache_generations ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
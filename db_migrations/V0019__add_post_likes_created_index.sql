@@ -0,0 +1,2 @@
+-- Сверка счётчиков лайков в sweeper выбирает посты, которые лайкали недавно
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_post_likes_created ON post_likes(created_at);
@@ -0,0 +1,14 @@
+-- Колонки с Discord ID остались от первой схемы (V0001): с V0002 пользователи,
+-- админы, санкции и логи связаны по user_id/admin_id, и обработчики эти
+-- колонки не заполняют. На рабочей базе NOT NULL с них уже снят, а база,
+-- собранная из миграций, падала на первой же вставке в admin_logs, bans,
+-- mutes, admins и users. DROP NOT NULL на уже допускающей NULL колонке ничего
+-- не делает, так что миграция безопасна и для рабочей базы.
+ALTER TABLE users ALTER COLUMN discord_id DROP NOT NULL;
+ALTER TABLE users ALTER COLUMN discord_username DROP NOT NULL;
+ALTER TABLE admins ALTER COLUMN discord_id DROP NOT NULL;
+ALTER TABLE bans ALTER COLUMN user_discord_id DROP NOT NULL;
+ALTER TABLE bans ALTER COLUMN banned_by DROP NOT NULL;
+ALTER TABLE mutes ALTER COLUMN user_discord_id DROP NOT NULL;
+ALTER TABLE mutes ALTER COLUMN muted_by DROP NOT NULL;
+ALTER TABLE admin_logs ALTER COLUMN admin_discord_id DROP NOT NULL;
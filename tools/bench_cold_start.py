@@ -0,0 +1,121 @@
+"""Замер холодного старта функций из backend/
+
+Каждая функция импортируется в отдельном свежем процессе --runs раз; меряется
+время импорта index и первого preflight-вызова, а также какие тяжёлые модули
+успели загрузиться. Медианы сравниваются с tools/cold_start_budget.json:
+превышение бюджета больше чем на --tolerance или загрузка PyJWT/psycopg2 на
+preflight завершают скрипт с ненулевым кодом.
+
+    python tools/bench_cold_start.py --runs 9 --output cold_start.json
+    python tools/bench_cold_start.py --update-budget
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT, 'backend')
+BUDGET_PATH = os.path.join(ROOT, 'tools', 'cold_start_budget.json')
+
+# Модули, которые не должны загружаться до первого обращения к БД или токену
+HEAVY_MODULES = ('jwt', 'psycopg2')
+
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import index
+imported = time.perf_counter()
+index.handler({'httpMethod': 'OPTIONS', 'headers': {}}, None)
+finished = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'preflight_ms': (finished - imported) * 1000,
+    'loaded': [name for name in HEAVY_MODULES if type(sys.modules.get(name)).__name__ == 'module']
+}))
+'''
+
+
+def list_functions() -> list:
+    # HTTP-функции перечислены в func2url.json; плановый sweeper preflight не получает
+    with open(os.path.join(BACKEND_DIR, 'func2url.json')) as f:
+        return sorted(json.load(f))
+
+
+def probe(function: str) -> dict:
+    env = {**os.environ, 'STARTUP_REPORT': '0', 'PYTHONDONTWRITEBYTECODE': '1'}
+    result = subprocess.run(
+        [sys.executable, '-c', f'HEAVY_MODULES = {HEAVY_MODULES!r}\n' + PROBE],
+        cwd=os.path.join(BACKEND_DIR, function),
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure(function: str, runs: int) -> dict:
+    samples = [probe(function) for _ in range(runs)]
+    imports = [sample['import_ms'] for sample in samples]
+    return {
+        'import_ms_p50': round(statistics.median(imports), 2),
+        'import_ms_max': round(max(imports), 2),
+        'preflight_ms_p50': round(statistics.median(sample['preflight_ms'] for sample in samples), 3),
+        'preflight_loaded': sorted({name for sample in samples for name in sample['loaded']})
+    }
+
+
+def load_budget() -> dict:
+    if not os.path.exists(BUDGET_PATH):
+        return {}
+    with open(BUDGET_PATH) as f:
+        return json.load(f)
+
+
+def check(results: dict, budget: dict, tolerance: float) -> list:
+    failures = []
+    for function, result in results.items():
+        limit = budget.get(function)
+        if limit is not None and result['import_ms_p50'] > limit * (1 + tolerance):
+            failures.append(f"{function}: import {result['import_ms_p50']} ms exceeds budget {limit} ms")
+        if result['preflight_loaded']:
+            failures.append(f"{function}: preflight loaded {', '.join(result['preflight_loaded'])}")
+    return failures
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Measure cold import time of each backend function')
+    parser.add_argument('functions', nargs='*', help='function directories (default: all)')
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed overshoot of the budget')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--update-budget', action='store_true', help='store current medians as the budget')
+    args = parser.parse_args(argv)
+
+    functions = args.functions or list_functions()
+    results = {function: measure(function, args.runs) for function in functions}
+
+    report = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    print(report)
+
+    budget = load_budget()
+    if args.update_budget:
+        budget.update({function: result['import_ms_p50'] for function, result in results.items()})
+        with open(BUDGET_PATH, 'w') as f:
+            f.write(json.dumps(budget, indent=2, sort_keys=True) + '\n')
+        return 0
+
+    failures = check(results, budget, args.tolerance)
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""Выгрузка admin_logs, forum_posts и forum_comments для офлайн-анализа
+
+Строки читаются именованным (серверным) курсором порциями по EXPORT_ITERSIZE,
+поэтому память не растёт с размером выгрузки. После каждой порции в stderr
+пишется токен продолжения: если выгрузка прервалась, её можно продолжить
+с последнего сохранённого токена через --resume в тот же --output. Токен хранит
+и длину файла на момент порции: недописанный хвост обрезается, а новые строки
+дописываются в конец. С --gzip каждая порция — отдельный gzip-член, поэтому
+дописанный файл остаётся корректным (gzip читает склеенные члены подряд).
+
+    DATABASE_URL=... python tools/export_data.py admin_logs --format csv --gzip \\
+        --from 2024-01-01 --to 2024-02-01 --output admin_logs.csv.gz
+"""
+import argparse
+import base64
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+from datetime import datetime
+
+import psycopg2
+
+EXPORT_ITERSIZE = int(os.environ.get('EXPORT_ITERSIZE', '5000'))
+
+# Таблица -> выгружаемые колонки
+EXPORT_TABLES = {
+    'admin_logs': ('id', 'admin_id', 'action_type', 'target_user_id', 'details', 'created_at'),
+    'forum_posts': ('id', 'user_id', 'title', 'content', 'category', 'views', 'likes',
+                    'comments_count', 'created_at', 'updated_at'),
+    'forum_comments': ('id', 'post_id', 'user_id', 'content', 'created_at')
+}
+
+
+def encode_resume_token(table: str, last_id: int, offset: int) -> str:
+    raw = json.dumps({'table': table, 'id': last_id, 'offset': offset}).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_resume_token(token: str, table: str) -> tuple:
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        last_id = int(data['id'])
+        offset = int(data['offset'])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError('Invalid resume token')
+    if data.get('table') != table:
+        raise ValueError(f"Resume token belongs to {data.get('table')}, not {table}")
+    return last_id, offset
+
+
+def parse_time(value: str):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'Invalid timestamp: {value}')
+
+
+def to_text(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def open_output(path: str, offset: int = 0):
+    if path == '-':
+        return sys.stdout.buffer
+    if not offset:
+        return open(path, 'wb')
+    # Продолжение: всё, что записано после последнего токена, отбрасывается
+    out = open(path, 'r+b')
+    out.truncate(offset)
+    out.seek(offset)
+    return out
+
+
+def export_table(conn, table: str, fmt: str, out, compress: bool = False, date_from=None, date_to=None,
+                 after_id: int = 0, offset: int = 0) -> dict:
+    columns = EXPORT_TABLES[table]
+    conditions = ['id > %s']
+    params = [after_id]
+    if date_from:
+        conditions.append('created_at >= %s')
+        params.append(date_from)
+    if date_to:
+        conditions.append('created_at < %s')
+        params.append(date_to)
+
+    # Ключ продолжения — id: он растёт вместе со временем вставки и идёт по первичному ключу
+    cur = conn.cursor(name=f'export_{table}')
+    cur.itersize = EXPORT_ITERSIZE
+    cur.execute(f"""
+        SELECT {', '.join(columns)}
+        FROM {table}
+        WHERE {' AND '.join(conditions)}
+        ORDER BY id
+    """, params)
+
+    text = io.StringIO()
+    writer = csv.writer(text) if fmt == 'csv' else None
+    if writer and not after_id:
+        writer.writerow(columns)
+
+    rows = 0
+    last_id = after_id
+    chunk = []
+
+    def flush_chunk():
+        nonlocal offset
+        if writer:
+            writer.writerows(chunk)
+        else:
+            text.write(''.join(
+                json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in chunk
+            ))
+        chunk.clear()
+        data = text.getvalue().encode('utf-8')
+        text.seek(0)
+        text.truncate()
+        if compress:
+            data = gzip.compress(data)
+        out.write(data)
+        out.flush()
+        offset += len(data)
+        print(json.dumps({
+            'table': table,
+            'rows': rows,
+            'resume': encode_resume_token(table, last_id, offset)
+        }), file=sys.stderr, flush=True)
+
+    for row in cur:
+        chunk.append([to_text(value) for value in row])
+        rows += 1
+        last_id = row[0]
+        if len(chunk) >= EXPORT_ITERSIZE:
+            flush_chunk()
+
+    if chunk or not rows:
+        flush_chunk()
+
+    cur.close()
+    return {'table': table, 'rows': rows, 'resume': encode_resume_token(table, last_id, offset)}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Export admin logs and forum data')
+    parser.add_argument('table', choices=sorted(EXPORT_TABLES))
+    parser.add_argument('--format', choices=('ndjson', 'csv'), default='ndjson')
+    parser.add_argument('--gzip', action='store_true')
+    parser.add_argument('--from', dest='date_from', type=parse_time)
+    parser.add_argument('--to', dest='date_to', type=parse_time)
+    parser.add_argument('--resume', help='token from the last progress line of an interrupted export')
+    parser.add_argument('--output', default='-', help="file path, '-' for stdout")
+    args = parser.parse_args(argv)
+
+    after_id = offset = 0
+    if args.resume:
+        try:
+            after_id, offset = decode_resume_token(args.resume, args.table)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.output == '-':
+            parser.error('--resume appends to the earlier --output file and cannot write to stdout')
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn.set_session(readonly=True)
+    out = open_output(args.output, offset)
+    try:
+        export_table(conn, args.table, args.format, out, args.gzip, args.date_from, args.date_to, after_id, offset)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+-- Фиксированные данные одноразовой базы (см. localdb.apply_fixtures): кейсы пагинации
+-- в tests.json сверяют по ним точные id и порядок страниц. Строки живут в своей
+-- категории и у своего пользователя, поэтому данные seed_data.py их не задевают.
+-- id постов, комментариев и записей журнала заданы явно (на пустых после миграций
+-- таблицах), последовательности после вставки сдвигаются вперёд.
+
+INSERT INTO users (discord_id, discord_username, username, password_hash, nickname, created_at)
+VALUES ('fixture_paging', 'paging_fixture', 'paging_fixture', 'fixture', 'Paging fixture', '2022-06-01 00:00:00');
+
+-- Лента категории fixtures: посты 4 и 5 созданы в одну секунду, порядок между ними
+-- задаёт id. По убыванию (created_at, id): 5, 4, 3, 2, 1.
+INSERT INTO forum_posts (id, user_id, title, content, category, created_at, updated_at)
+SELECT v.id, u.id, v.title, 'Fixture post body', 'fixtures', v.created_at, v.created_at
+FROM users u, (VALUES
+    (1, 'Fixture post 1', TIMESTAMP '2022-06-01 10:00:00'),
+    (2, 'Fixture post 2', TIMESTAMP '2022-06-01 11:00:00'),
+    (3, 'Fixture post 3', TIMESTAMP '2022-06-01 12:00:00'),
+    (4, 'Fixture post 4', TIMESTAMP '2022-06-01 13:00:00'),
+    (5, 'Fixture post 5', TIMESTAMP '2022-06-01 13:00:00')
+) AS v(id, title, created_at)
+WHERE u.username = 'paging_fixture';
+
+SELECT setval(pg_get_serial_sequence('forum_posts', 'id'), (SELECT MAX(id) FROM forum_posts));
+
+-- Тред поста 1: комментарии 2 и 3 оставлены в одну секунду.
+-- По возрастанию (created_at, id): 1, 2, 3, 4, 5.
+INSERT INTO forum_comments (id, post_id, user_id, content, created_at)
+SELECT v.id, 1, u.id, 'Fixture comment ' || v.id, v.created_at
+FROM users u, (VALUES
+    (1, TIMESTAMP '2022-06-01 10:05:00'),
+    (2, TIMESTAMP '2022-06-01 10:10:00'),
+    (3, TIMESTAMP '2022-06-01 10:10:00'),
+    (4, TIMESTAMP '2022-06-01 10:20:00'),
+    (5, TIMESTAMP '2022-06-01 10:30:00')
+) AS v(id, created_at)
+WHERE u.username = 'paging_fixture';
+
+UPDATE forum_posts SET comments_count = 5 WHERE id = 1;
+
+SELECT setval(pg_get_serial_sequence('forum_comments', 'id'), (SELECT MAX(id) FROM forum_comments));
+
+-- Поиск: слово quokka встречается только здесь (в seed_data.py его нет) — в постах 2, 3, 4
+-- и комментариях 4, 5. У постов с одинаковым текстом ранг равный, порядок задают kind и id.
+UPDATE forum_posts SET content = 'Fixture post body about a quokka' WHERE id IN (2, 3, 4);
+UPDATE forum_comments SET content = 'Fixture comment about a quokka' WHERE id IN (4, 5);
+
+-- Журнал действий над paging_fixture: записи 3 и 4 сделаны в одну секунду.
+-- По убыванию (created_at, id): 5, 4, 3, 2, 1.
+INSERT INTO admin_logs (id, admin_id, admin_discord_id, action_type, target_user_id, target_discord_id, details, created_at)
+SELECT v.id, o.id, o.discord_id, 'WARN', u.id, u.discord_id, 'Fixture log ' || v.id, v.created_at
+FROM users u, users o, (VALUES
+    (1, TIMESTAMP '2022-06-01 09:00:00'),
+    (2, TIMESTAMP '2022-06-01 09:30:00'),
+    (3, TIMESTAMP '2022-06-01 10:00:00'),
+    (4, TIMESTAMP '2022-06-01 10:00:00'),
+    (5, TIMESTAMP '2022-06-01 10:30:00')
+) AS v(id, created_at)
+WHERE u.username = 'paging_fixture' AND o.username = 'TOURIST_WAGNERA' AND o.is_owner = TRUE;
+
+SELECT setval(pg_get_serial_sequence('admin_logs', 'id'), (SELECT MAX(id) FROM admin_logs));
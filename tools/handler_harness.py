@@ -0,0 +1,368 @@
+"""Локальный прогон tests.json и замер задержек обработчиков
+
+Для каждой функции из backend/ с файлом tests.json:
+  1. поднимается одноразовая база из db_migrations/ (см. localdb.py);
+  2. каждый кейс выполняется один раз и сверяется с expectedStatus/expectedBody;
+  3. затем кейс прогоняется --runs раз в --concurrency параллельных процессах.
+
+Процесс на воркер повторяет модель платформы (один запрос на контейнер за раз):
+release_all_conns в handler освобождает все соединения модуля. Число запросов
+к БД берётся из заголовка Server-Timing, который выставляет сама функция; для
+функций без него (sweeper) — из cursor_factory, подставленного в psycopg2.connect.
+Если маршрут превысил бюджет запросов из tools/query_budgets.json, кейс падает:
+так ловится возврат к запросу на каждую строку.
+
+С --preset база заполняется seed_data.py, и вслед за tests.json прогоняются
+сценарии функции из tools/plan_scenarios.json (от них ждём 2xx) — так
+замеряются маршруты на объёмах, например массовая модерация 1000 пользователей.
+
+Отчёт (p50/p95/p99, запросы на вызов, пропускная способность) пишется в
+--output в JSON с отсортированными ключами, чтобы его можно было сравнивать
+между коммитами.
+
+    HARNESS_ADMIN_URL=postgresql://postgres@localhost/postgres \\
+        python tools/handler_harness.py --runs 50 --concurrency 4 --output harness.json
+    python tools/handler_harness.py admin --preset small --runs 10
+"""
+import argparse
+import concurrent.futures
+import importlib
+import json
+import math
+import os
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+from urllib.parse import parse_qsl
+
+import jwt
+import psycopg2
+import psycopg2.extensions
+
+import seed_data
+from localdb import ROOT, disposable_database
+
+BACKEND_DIR = os.path.join(ROOT, 'backend')
+BUDGETS_PATH = os.path.join(ROOT, 'tools', 'query_budgets.json')
+SCENARIOS_PATH = os.path.join(ROOT, 'tools', 'plan_scenarios.json')
+HARNESS_JWT_SECRET = 'harness_secret'
+HARNESS_SWEEPER_SECRET = 'harness_sweeper_secret'
+TYPE_PLACEHOLDERS = {'string': str, 'number': (int, float), 'boolean': bool}
+
+_worker = {'handler': None, 'queries': 0}
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        _worker['queries'] += 1
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        _worker['queries'] += 1
+        return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        _worker['queries'] += 1
+        return super().copy_expert(sql, file, size)
+
+
+def init_worker(function: str, env: dict, token: str = None) -> None:
+    os.environ.update(env)
+    connect = psycopg2.connect
+
+    def counting_connect(*args, **kwargs):
+        kwargs.setdefault('cursor_factory', CountingCursor)
+        return connect(*args, **kwargs)
+
+    psycopg2.connect = counting_connect
+    sys.path.insert(0, os.path.join(BACKEND_DIR, function))
+    _worker['handler'] = importlib.import_module('index').handler
+    # Принципал кэшируется в процессе: без прогрева его загрузка из БД достаётся
+    # кейсу, который первым попал в холодный воркер, и бюджет маршрута плавает
+    core = sys.modules.get('core')
+    if token and core is not None:
+        core.resolve_principal(token)
+
+
+def build_event(case: dict, token: str) -> dict:
+    # Параметры берутся из queryStringParameters кейса, как в событии платформы;
+    # строка запроса в path тоже поддерживается и декодируется так же, как URL
+    path, _, query = case.get('path', '/').partition('?')
+    params = dict(parse_qsl(query))
+    params.update(case.get('queryStringParameters') or {})
+    body = case.get('body')
+    if body is not None and not isinstance(body, str):
+        body = json.dumps(body)
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['X-Authorization'] = f'Bearer {token}'
+    headers.update(case.get('headers') or {})
+    return {
+        'httpMethod': case.get('method', 'GET'),
+        'headers': headers,
+        'params': {'path': path},
+        'queryStringParameters': params or None,
+        'body': body,
+        'isBase64Encoded': False
+    }
+
+
+def reported_queries(headers: dict):
+    match = re.search(r'queries;desc="(\d+)"', headers.get('Server-Timing', ''))
+    return int(match.group(1)) if match else None
+
+
+def invoke(event: dict, runs: int) -> list:
+    samples = []
+    for _ in range(runs):
+        queries_before = _worker['queries']
+        started = time.perf_counter()
+        response = _worker['handler'](event, None)
+        elapsed = time.perf_counter() - started
+        reported = reported_queries(response.get('headers') or {})
+        samples.append({
+            'ms': elapsed * 1000,
+            'queries': reported if reported is not None else _worker['queries'] - queries_before,
+            'status': response.get('statusCode'),
+            'headers': response.get('headers') or {},
+            'body': response.get('body'),
+            'base64': response.get('isBase64Encoded', False)
+        })
+    return samples
+
+
+def matches(expected, actual) -> bool:
+    if expected == actual:
+        return True
+    if isinstance(expected, str) and expected in TYPE_PLACEHOLDERS:
+        return isinstance(actual, TYPE_PLACEHOLDERS[expected])
+    if isinstance(expected, dict):
+        return isinstance(actual, dict) and all(
+            key in actual and matches(value, actual[key]) for key, value in expected.items()
+        )
+    if isinstance(expected, list):
+        return isinstance(actual, list) and len(actual) >= len(expected) and all(
+            matches(value, actual[index]) for index, value in enumerate(expected)
+        )
+    return False
+
+
+def check_case(case: dict, sample: dict) -> list:
+    problems = []
+    if 'expectedStatus' not in case and case.get('scenario'):
+        if not 200 <= sample['status'] < 300:
+            problems.append(f"status {sample['status']}, expected 2xx")
+    elif sample['status'] != case.get('expectedStatus', 200):
+        problems.append(f"status {sample['status']} != {case.get('expectedStatus', 200)}")
+    if 'expectedBody' in case:
+        if sample['base64']:
+            problems.append('body is base64-encoded')
+            return problems
+        try:
+            body = json.loads(sample['body'] or 'null')
+        except ValueError:
+            problems.append('body is not JSON')
+            return problems
+        expected = case['expectedBody']
+        ok = matches(expected, body) if case.get('bodyMatcher') == 'partial' else expected == body
+        if not ok:
+            problems.append(f"body {str(body)[:200]} does not match {json.dumps(expected)[:200]}")
+    return problems
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(samples: list, wall: float) -> dict:
+    latencies = [sample['ms'] for sample in samples]
+    statuses = {}
+    for sample in samples:
+        statuses[str(sample['status'])] = statuses.get(str(sample['status']), 0) + 1
+    return {
+        'requests': len(samples),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'queries_per_request': round(sum(sample['queries'] for sample in samples) / len(samples), 2),
+        'max_queries': max(sample['queries'] for sample in samples),
+        'throughput_rps': round(len(samples) / wall, 1) if wall else None,
+        'statuses': statuses
+    }
+
+
+def owner_token(database_url: str) -> str:
+    conn = psycopg2.connect(database_url)
+    cur = conn.cursor()
+    cur.execute("SELECT id, username FROM users WHERE is_owner = TRUE ORDER BY id LIMIT 1")
+    row = cur.fetchone()
+    cur.close()
+    conn.close()
+    if not row:
+        return None
+    return jwt.encode({
+        'user_id': row[0],
+        'username': row[1],
+        'is_owner': True,
+        'exp': datetime.utcnow() + timedelta(hours=1)
+    }, HARNESS_JWT_SECRET, algorithm='HS256')
+
+
+def list_functions() -> list:
+    return sorted(
+        name for name in os.listdir(BACKEND_DIR)
+        if os.path.isfile(os.path.join(BACKEND_DIR, name, 'tests.json'))
+    )
+
+
+def load_budgets() -> dict:
+    if not os.path.exists(BUDGETS_PATH):
+        return {}
+    with open(BUDGETS_PATH, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def expand_generated(case: dict) -> dict:
+    # Длинные списки (1000 имён для массовой модерации) в сценарии не хранятся:
+    # generatedBody задаёт шаблон и число элементов, поле тела собирается здесь
+    generated = case.get('generatedBody')
+    if not generated:
+        return case
+    body = dict(case.get('body') or {})
+    for field, spec in generated.items():
+        body[field] = [spec['pattern'].format(index) for index in range(spec['count'])]
+    return {**case, 'body': body}
+
+
+def scenario_cases(function: str) -> list:
+    with open(SCENARIOS_PATH, encoding='utf-8') as f:
+        scenarios = json.load(f).get('scenarios', {}).get(function, [])
+    return [{**expand_generated(case), 'scenario': True} for case in scenarios]
+
+
+def run_function(function: str, env: dict, token: str, runs: int, concurrency: int, budgets: dict,
+                 scenarios: bool = False) -> list:
+    with open(os.path.join(BACKEND_DIR, function, 'tests.json'), encoding='utf-8') as f:
+        cases = json.load(f)['tests']
+    if scenarios:
+        cases.extend(scenario_cases(function))
+
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=concurrency, initializer=init_worker, initargs=(function, env, token)
+    ) as pool:
+        for case in cases:
+            event = build_event(case, token)
+            first = pool.submit(invoke, event, 1).result()[0]
+            problems = check_case(case, first)
+
+            per_worker = [runs // concurrency + (1 if i < runs % concurrency else 0) for i in range(concurrency)]
+            started = time.perf_counter()
+            futures = [pool.submit(invoke, event, count) for count in per_worker if count]
+            samples = [sample for future in futures for sample in future.result()]
+            wall = time.perf_counter() - started
+
+            # Бюджет общий для маршрута: кейсы с разными параметрами запроса делят его
+            route = f"{case.get('method', 'GET')} {case.get('path', '/').split('?')[0]}"
+            budget = budgets.get(function, {}).get(route)
+            most = max([first['queries']] + [sample['queries'] for sample in samples])
+            if budget is not None and most > budget:
+                problems.append(f'{most} queries per request exceeds budget of {budget}')
+
+            results.append({
+                'function': function,
+                'name': case.get('name'),
+                'route': route,
+                'query_budget': budget,
+                'passed': not problems,
+                'problems': problems,
+                'first_call': {'ms': round(first['ms'], 3), 'queries': first['queries']},
+                'bench': summarize(samples, wall)
+            })
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Replay tests.json against a local Postgres and benchmark handlers')
+    parser.add_argument('functions', nargs='*', help='function directories (default: all with tests.json)')
+    parser.add_argument('--admin-url', help='server to create the disposable database on (default: HARNESS_ADMIN_URL)')
+    parser.add_argument('--runs', type=int, default=20, help='benchmark invocations per case')
+    parser.add_argument('--concurrency', type=int, default=4, help='parallel worker processes per function')
+    parser.add_argument('--output', help='write the JSON report to this file')
+    parser.add_argument('--preset', choices=sorted(seed_data.PRESETS),
+                        help='seed the database and also replay tools/plan_scenarios.json')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--keep-db', action='store_true')
+    parser.add_argument('--update-budgets', action='store_true',
+                        help='store the observed max queries per route as the new budgets')
+    args = parser.parse_args(argv)
+
+    functions = args.functions or list_functions()
+    started = time.perf_counter()
+    with disposable_database(args.admin_url, keep=args.keep_db) as database_url:
+        if args.preset:
+            seed_data.generate(database_url, args.preset, args.seed, log=lambda message: print(message, file=sys.stderr))
+        env = {
+            'DATABASE_URL': database_url,
+            'JWT_SECRET': HARNESS_JWT_SECRET,
+            'SWEEPER_SECRET': HARNESS_SWEEPER_SECRET,
+            'STARTUP_REPORT': '0',
+            'REQUEST_LOG': '0',
+            # Поколения кэшей (принципала и ответов) сверяются на каждом запросе, а записи
+            # живут дольше прогона: число запросов не зависит от того, попал ли кейс на
+            # двухсекундную сверку или на истёкшую запись, и бюджет считается по худшему
+            # установившемуся случаю
+            'PRINCIPAL_GENERATION_CHECK': '0',
+            'PRINCIPAL_TTL': '86400',
+            'CACHE_GENERATION_CHECK': '0',
+            'CACHE_TTL': '86400'
+        }
+        token = owner_token(database_url)
+        budgets = {} if args.update_budgets else load_budgets()
+        cases = []
+        for function in functions:
+            cases.extend(run_function(function, env, token, args.runs, args.concurrency, budgets,
+                                      scenarios=bool(args.preset)))
+
+    if args.update_budgets:
+        # Прогон всех функций на пустой базе пересобирает бюджеты с нуля, прогон с --preset
+        # только поднимает их до увиденного на объёмах и добавляет маршруты сценариев
+        budgets = {} if not args.functions and not args.preset else load_budgets()
+        for case in cases:
+            most = max(case['first_call']['queries'], case['bench']['max_queries'])
+            routes = budgets.setdefault(case['function'], {})
+            routes[case['route']] = max(routes.get(case['route'], 0), most)
+        with open(BUDGETS_PATH, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(budgets, indent=2, sort_keys=True) + '\n')
+
+    report = {
+        'runs': args.runs,
+        'concurrency': args.concurrency,
+        'duration_s': round(time.perf_counter() - started, 2),
+        'passed': sum(1 for case in cases if case['passed']),
+        'failed': sum(1 for case in cases if not case['passed']),
+        'cases': cases
+    }
+    text = json.dumps(report, indent=2, sort_keys=True, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+
+    for case in cases:
+        bench = case['bench']
+        mark = 'ok  ' if case['passed'] else 'FAIL'
+        print(f"{mark} {case['function']:8} {case['route']:28} p50={bench['p50_ms']:.1f}ms "
+              f"p95={bench['p95_ms']:.1f}ms p99={bench['p99_ms']:.1f}ms q/req={bench['queries_per_request']} "
+              f"rps={bench['throughput_rps']}  {case['name']}")
+        for problem in case['problems']:
+            print(f'       {problem}')
+    return 1 if report['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""Отчёт об использовании индексов
+
+Читает pg_stat_user_indexes и помечает:
+  * unused — idx_scan = 0 с момента сброса статистики (уникальные и первичные
+    ключи не в счёт: они держат ограничение, даже если по ним не ищут);
+  * invalid — индексы, оставшиеся от оборвавшегося CREATE INDEX CONCURRENTLY;
+  * redundant — btree-индексы, ключ которых является началом ключа другого
+    индекса той же таблицы с тем же условием.
+
+Статистика накапливается с последнего pg_stat_reset, поэтому по рабочей базе
+отчёт имеет смысл снимать спустя время после деплоя. С --disposable база
+собирается из db_migrations/, заполняется seed_data.py и через неё
+прогоняются кейсы tests.json и сценарии plan_scenarios.json — видно, какие
+индексы не нужны ни одному маршруту обработчиков.
+
+    python tools/index_usage.py --database-url "$DATABASE_URL"
+    HARNESS_ADMIN_URL=postgresql://postgres@localhost/postgres \\
+        python tools/index_usage.py --disposable --preset small --output indexes.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import psycopg2
+
+import handler_harness
+import plan_check
+import seed_data
+from localdb import disposable_database
+
+# Статистика бэкенда попадает в pg_stat_* не сразу после его завершения
+STATS_FLUSH_WAIT = 1.0
+
+
+def fetch_indexes(database_url: str) -> tuple:
+    conn = psycopg2.connect(database_url)
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT s.relname, s.indexrelname, s.idx_scan, s.idx_tup_read,
+                   pg_relation_size(s.indexrelid), i.indisunique, i.indisprimary, i.indisvalid,
+                   am.amname, i.indexprs IS NULL, i.indkey::text,
+                   COALESCE(pg_get_expr(i.indpred, i.indrelid), ''), pg_get_indexdef(s.indexrelid)
+            FROM pg_stat_user_indexes s
+            JOIN pg_index i ON i.indexrelid = s.indexrelid
+            JOIN pg_class c ON c.oid = s.indexrelid
+            JOIN pg_am am ON am.oid = c.relam
+            WHERE s.schemaname = 'public'
+            ORDER BY s.relname, s.indexrelname
+        """)
+        indexes = [{
+            'table': row[0],
+            'index': row[1],
+            'scans': row[2],
+            'tuples_read': row[3],
+            'size_bytes': row[4],
+            'unique': row[5] or row[6],
+            'valid': row[7],
+            'method': row[8],
+            'plain_columns': row[9],
+            'key': row[10].split(),
+            'predicate': row[11],
+            'definition': row[12]
+        } for row in cur.fetchall()]
+        cur.execute("SELECT stats_reset FROM pg_stat_database WHERE datname = current_database()")
+        stats_reset = cur.fetchone()[0]
+    finally:
+        cur.close()
+        conn.close()
+    return indexes, stats_reset.isoformat() if stats_reset else None
+
+
+def redundant_with(index: dict, indexes: list):
+    if index['unique'] or index['method'] != 'btree' or not index['plain_columns']:
+        return None
+    for other in indexes:
+        if (other is not index and other['table'] == index['table'] and other['method'] == 'btree'
+                and other['plain_columns'] and other['predicate'] == index['predicate']
+                and len(other['key']) > len(index['key'])
+                and other['key'][:len(index['key'])] == index['key']):
+            return other['index']
+    return None
+
+
+def classify(indexes: list, ignored: set) -> list:
+    findings = []
+    for index in indexes:
+        if index['index'] in ignored:
+            continue
+        if not index['valid']:
+            findings.append({'index': index['index'], 'kind': 'invalid'})
+        elif index['scans'] == 0 and not index['unique']:
+            findings.append({'index': index['index'], 'kind': 'unused'})
+        covering = redundant_with(index, indexes)
+        if covering:
+            findings.append({'index': index['index'], 'kind': 'redundant', 'covered_by': covering})
+    return findings
+
+
+def exercise_handlers(database_url: str, preset: str, seed: int) -> None:
+    seed_data.generate(database_url, preset, seed, log=lambda message: print(message, file=sys.stderr))
+    conn = psycopg2.connect(database_url)
+    conn.autocommit = True
+    cur = conn.cursor()
+    # Генерация данных и ANALYZE тоже ходят по индексам, считаем только обработчики
+    cur.execute('ANALYZE')
+    cur.execute('SELECT pg_stat_reset()')
+    cur.close()
+    conn.close()
+    env = {'DATABASE_URL': database_url, 'JWT_SECRET': handler_harness.HARNESS_JWT_SECRET,
+           'SWEEPER_SECRET': handler_harness.HARNESS_SWEEPER_SECRET, 'STARTUP_REPORT': '0', 'REQUEST_LOG': '0'}
+    token = handler_harness.owner_token(database_url)
+    _, failed = plan_check.capture_statements(handler_harness.list_functions(), env, token, plan_check.load_scenarios())
+    for problem in failed:
+        print(f'warn {problem}', file=sys.stderr)
+    time.sleep(STATS_FLUSH_WAIT)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Report unused, invalid and redundant indexes')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--disposable', action='store_true',
+                        help='build a seeded throwaway database and replay handler routes against it')
+    parser.add_argument('--admin-url', help='server for the disposable database (default: HARNESS_ADMIN_URL)')
+    parser.add_argument('--preset', choices=sorted(seed_data.PRESETS), default='small')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--ignore', action='append', default=[], help='index name to leave out of the findings')
+    parser.add_argument('--strict', action='store_true', help='exit with 1 if anything is found')
+    parser.add_argument('--output', help='write the full report as JSON')
+    args = parser.parse_args(argv)
+
+    if args.disposable:
+        with disposable_database(args.admin_url) as database_url:
+            exercise_handlers(database_url, args.preset, args.seed)
+            indexes, stats_reset = fetch_indexes(database_url)
+    elif args.database_url:
+        indexes, stats_reset = fetch_indexes(args.database_url)
+    else:
+        parser.error('--database-url, DATABASE_URL or --disposable is required')
+
+    findings = classify(indexes, set(args.ignore))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'stats_reset': stats_reset, 'indexes': indexes, 'findings': findings},
+                               indent=2, sort_keys=True) + '\n')
+
+    print(f'statistics since {stats_reset or "server start"}')
+    for index in indexes:
+        print(f"{index['table']:20} {index['index']:40} scans={index['scans']:<8} "
+              f"size={index['size_bytes'] // 1024}kB")
+    for finding in findings:
+        extra = f" (covered by {finding['covered_by']})" if 'covered_by' in finding else ''
+        print(f"{finding['kind']:9} {finding['index']}{extra}")
+    return 1 if findings and args.strict else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""Одноразовая локальная база, собранная из db_migrations/
+
+Используется стендом обработчиков, генератором данных и проверкой планов.
+База создаётся либо на сервере из --admin-url / HARNESS_ADMIN_URL (отдельная
+CREATE DATABASE на время прогона), либо, если адрес не задан, во временном
+кластере через initdb/pg_ctl из PATH. После миграций загружается tools/fixtures.sql —
+небольшой фиксированный набор строк, на который опираются кейсы пагинации в
+tests.json. По выходе база удаляется.
+"""
+import contextlib
+import hashlib
+import os
+import re
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+import psycopg2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MIGRATIONS_DIR = os.path.join(ROOT, 'db_migrations')
+FIXTURES_PATH = os.path.join(ROOT, 'tools', 'fixtures.sql')
+# V0004 записывает владельцу хэш, который не совпадает с паролем из кейса входа
+# в backend/auth/tests.json. Одноразовой базе выставляется хэш этого пароля, чтобы
+# вход владельца проверялся локально так же, как на рабочей базе.
+OWNER_USERNAME = 'TOURIST_WAGNERA'
+OWNER_PASSWORD = 'wagnera_tut$45$'
+
+
+def migration_files() -> list:
+    files = [name for name in os.listdir(MIGRATIONS_DIR) if re.match(r'V\d+__.*\.sql$', name)]
+    return sorted(files, key=lambda name: int(re.match(r'V(\d+)__', name).group(1)))
+
+
+def split_statements(sql: str) -> list:
+    # CREATE INDEX CONCURRENTLY нельзя отправлять пачкой, поэтому файл режется на
+    # отдельные операторы с учётом строк, комментариев и $$-блоков
+    statements = []
+    current = []
+    i = 0
+    length = len(sql)
+    while i < length:
+        char = sql[i]
+        if sql.startswith('--', i):
+            end = sql.find('\n', i)
+            i = length if end == -1 else end + 1
+            continue
+        if sql.startswith('/*', i):
+            end = sql.find('*/', i + 2)
+            i = length if end == -1 else end + 2
+            continue
+        if char == "'":
+            end = i + 1
+            while end < length:
+                if sql[end] == "'" and sql.startswith("''", end):
+                    end += 2
+                    continue
+                if sql[end] == "'":
+                    break
+                end += 1
+            current.append(sql[i:end + 1])
+            i = end + 1
+            continue
+        dollar = re.match(r'\$[A-Za-z_]*\$', sql[i:])
+        if dollar:
+            tag = dollar.group(0)
+            end = sql.find(tag, i + len(tag))
+            end = length if end == -1 else end + len(tag)
+            current.append(sql[i:end])
+            i = end
+            continue
+        if char == ';':
+            statement = ''.join(current).strip()
+            if statement:
+                statements.append(statement)
+            current = []
+        else:
+            current.append(char)
+        i += 1
+    statement = ''.join(current).strip()
+    if statement:
+        statements.append(statement)
+    return statements
+
+
+def apply_migrations(database_url: str, upto: int = None, skip: tuple = ()) -> list:
+    applied = []
+    conn = psycopg2.connect(database_url)
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        for name in migration_files():
+            version = int(re.match(r'V(\d+)__', name).group(1))
+            if upto is not None and version > upto:
+                break
+            if version in skip:
+                continue
+            with open(os.path.join(MIGRATIONS_DIR, name), encoding='utf-8') as f:
+                for statement in split_statements(f.read()):
+                    cur.execute(statement)
+            applied.append(name)
+    finally:
+        cur.close()
+        conn.close()
+    return applied
+
+
+def apply_fixtures(database_url: str) -> None:
+    conn = psycopg2.connect(database_url)
+    cur = conn.cursor()
+    cur.execute("UPDATE users SET password_hash = %s WHERE username = %s AND is_owner = TRUE",
+                (hashlib.sha256(OWNER_PASSWORD.encode()).hexdigest(), OWNER_USERNAME))
+    with open(FIXTURES_PATH, encoding='utf-8') as f:
+        for statement in split_statements(f.read()):
+            cur.execute(statement)
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def with_database(url: str, database: str) -> str:
+    parts = urlsplit(url)
+    return urlunsplit(parts._replace(path='/' + database))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def temporary_cluster():
+    initdb = shutil.which('initdb')
+    pg_ctl = shutil.which('pg_ctl')
+    if not initdb or not pg_ctl:
+        raise RuntimeError('No --admin-url/HARNESS_ADMIN_URL given and initdb/pg_ctl are not on PATH')
+    data_dir = tempfile.mkdtemp(prefix='harness_pg_')
+    port = free_port()
+    try:
+        subprocess.run([initdb, '-D', data_dir, '-U', 'postgres', '-A', 'trust', '-E', 'UTF8', '--no-sync'],
+                       check=True, capture_output=True)
+        subprocess.run([pg_ctl, '-D', data_dir, '-w', '-l', os.path.join(data_dir, 'server.log'),
+                        '-o', f'-p {port} -k {data_dir} -c listen_addresses=127.0.0.1 -c fsync=off',
+                        'start'], check=True, capture_output=True)
+        try:
+            yield f'postgresql://postgres@127.0.0.1:{port}/postgres'
+        finally:
+            subprocess.run([pg_ctl, '-D', data_dir, '-m', 'fast', 'stop'], capture_output=True)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def disposable_database(admin_url: str = None, keep: bool = False, upto: int = None, skip: tuple = ()):
+    admin_url = admin_url or os.environ.get('HARNESS_ADMIN_URL')
+    with contextlib.ExitStack() as stack:
+        if not admin_url:
+            admin_url = stack.enter_context(temporary_cluster())
+        database = f'harness_{os.getpid()}_{int(time.time())}'
+        admin = psycopg2.connect(admin_url)
+        admin.autocommit = True
+        # Миграции и данные содержат кириллицу, а кластер может быть в SQL_ASCII
+        admin.cursor().execute(f"CREATE DATABASE {database} ENCODING 'UTF8' TEMPLATE template0")
+        url = with_database(admin_url, database)
+        try:
+            apply_migrations(url, upto, skip)
+            apply_fixtures(url)
+            yield url
+        finally:
+            if not keep:
+                admin.cursor().execute(f'DROP DATABASE IF EXISTS {database} WITH (FORCE)')
+            admin.close()
@@ -0,0 +1,383 @@
+"""Проверка планов запросов обработчиков на синтетических данных
+
+SQL не выписывается вручную, а снимается с самих обработчиков: на базе из
+db_migrations/ с данными seed_data.py прогоняются кейсы tests.json и сценарии
+из tools/plan_scenarios.json, а курсор функции записывает каждый выполненный
+запрос. Затем каждый уникальный запрос прогоняется через
+EXPLAIN (ANALYZE, BUFFERS) в откатываемой транзакции.
+
+Проверка падает, если:
+  * кейс tests.json ответил не тем статусом, что в expectedStatus, или
+    сценарий — не 2xx;
+  * EXPLAIN запроса завершился ошибкой;
+  * в плане есть Seq Scan по таблице крупнее --large-table-rows строк
+    (кроме явно разрешённых в plan_scenarios.json);
+  * число буферов выросло больше чем на --buffer-threshold относительно
+    снимка tools/plan_snapshots.json.
+Изменившаяся форма плана выводится как предупреждение. --update перезаписывает снимок.
+Снимок хранит версию сервера: планы и буферы зависят от старшей версии PostgreSQL
+(например, ANY(массив) по индексу в 16 и 18 читает разное число страниц), поэтому
+на сервере другой старшей версии сравнение со снимком пропускается с предупреждением.
+
+Для замеров до и после миграции схему можно собрать не целиком: до версии
+(--upto) или без отдельных миграций (--skip, когда обработчикам нужны более
+поздние) — а отчёты сравнить по маршрутам (--compare): суммарное время
+выполнения и буферы. С --benchmark сравнение сохраняется под меткой в
+tools/plan_benchmarks.json рядом со снимком, вместе с пресетом и версией сервера.
+
+    HARNESS_ADMIN_URL=postgresql://postgres@localhost/postgres \\
+        python tools/plan_check.py --preset small --output plans.json
+    python tools/plan_check.py --upto 16 --output before.json
+    python tools/plan_check.py --output after.json --compare before.json
+    python tools/plan_check.py --skip 17 --output before.json
+    python tools/plan_check.py --compare before.json --benchmark V0017
+"""
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import re
+import sys
+
+import psycopg2
+import psycopg2.extensions
+
+import handler_harness
+import seed_data
+from localdb import ROOT, disposable_database
+
+SCENARIOS_PATH = handler_harness.SCENARIOS_PATH
+SNAPSHOTS_PATH = os.path.join(ROOT, 'tools', 'plan_snapshots.json')
+BENCHMARKS_PATH = os.path.join(ROOT, 'tools', 'plan_benchmarks.json')
+SKIPPED_STATEMENTS = re.compile(r'^\s*(SET|SHOW|BEGIN|COMMIT|ROLLBACK|COPY|CREATE\s+TEMP|ANALYZE|SELECT\s+1\s*$)', re.I)
+TEMP_SETUP = re.compile(r'^\s*(CREATE\s+TEMP(ORARY)?\s+TABLE|ANALYZE)\b', re.I)
+
+_captured = []
+
+
+def capturing_class(base):
+    class CapturingCursor(base):
+        def execute(self, query, vars=None):
+            _captured.append((query, self.mogrify(query, vars).decode('utf-8')))
+            return super().execute(query, vars)
+    return CapturingCursor
+
+
+def init_capture(function: str, env: dict) -> None:
+    handler_harness.init_worker(function, env)
+    core = sys.modules.get('core')
+    if core is not None:
+        core._cursor_class = capturing_class(core.get_cursor_class())
+    else:
+        connect = psycopg2.connect
+        cursor_class = capturing_class(psycopg2.extensions.cursor)
+
+        def capturing_connect(*args, **kwargs):
+            kwargs['cursor_factory'] = cursor_class
+            return connect(*args, **kwargs)
+
+        psycopg2.connect = capturing_connect
+
+
+def unexpected_status(case: dict, status: int):
+    # Кейсы tests.json проверяются по expectedStatus, у сценариев ответ должен быть 2xx
+    expected = case.get('expectedStatus')
+    if expected is None:
+        return None if 200 <= status < 300 else f'status {status}, expected 2xx'
+    return None if status == expected else f'status {status} != {expected}'
+
+
+def run_events(events: list) -> tuple:
+    statements = []
+    problems = []
+    for route, case, event in events:
+        del _captured[:]
+        response = handler_harness._worker['handler'](event, None)
+        problem = unexpected_status(case, response.get('statusCode'))
+        if problem:
+            problems.append(f"{route} ({case.get('name')}): {problem}: {str(response.get('body'))[:200]}")
+        statements.extend((route, template, sql) for template, sql in _captured)
+    return statements, problems
+
+
+def load_scenarios() -> dict:
+    with open(SCENARIOS_PATH, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def function_cases(function: str, scenarios: dict) -> list:
+    cases = []
+    tests_path = os.path.join(handler_harness.BACKEND_DIR, function, 'tests.json')
+    if os.path.exists(tests_path):
+        with open(tests_path, encoding='utf-8') as f:
+            cases.extend(json.load(f)['tests'])
+    for case in scenarios.get('scenarios', {}).get(function, []):
+        cases.append(handler_harness.expand_generated(case))
+    return cases
+
+
+def capture_statements(functions: list, env: dict, token: str, scenarios: dict) -> tuple:
+    statements = []
+    problems = []
+    for function in functions:
+        events = [
+            (f"{function} {case.get('method', 'GET')} {case.get('path', '/').split('?')[0]}",
+             case, handler_harness.build_event(case, token))
+            for case in function_cases(function, scenarios)
+        ]
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=1, initializer=init_capture, initargs=(function, env)
+        ) as pool:
+            captured, failed = pool.submit(run_events, events).result()
+        statements.extend(captured)
+        problems.extend(failed)
+    return statements, problems
+
+
+def fingerprint(template: str) -> str:
+    normalized = ' '.join(template.split())
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:12]
+
+
+def plan_shape(node: dict, shape: list = None) -> list:
+    shape = [] if shape is None else shape
+    label = node['Node Type']
+    if node.get('Relation Name'):
+        label += f" on {node['Relation Name']}"
+    if node.get('Index Name'):
+        label += f" using {node['Index Name']}"
+    shape.append(label)
+    for child in node.get('Plans', []):
+        plan_shape(child, shape)
+    return shape
+
+
+def seq_scans(node: dict) -> set:
+    found = {node['Relation Name']} if node['Node Type'] == 'Seq Scan' else set()
+    for child in node.get('Plans', []):
+        found |= seq_scans(child)
+    return found
+
+
+def explain(conn, sql: str, setup: tuple = ()) -> dict:
+    # setup — временные таблицы, которые обработчик создал перед запросом (импорт ростера),
+    # и их ANALYZE; они живут до конца транзакции, поэтому создаются заново перед каждым EXPLAIN
+    cur = conn.cursor()
+    try:
+        for statement in setup:
+            cur.execute(statement)
+        cur.execute('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + sql)
+        plan = cur.fetchone()[0][0]
+    except psycopg2.IntegrityError:
+        # Вставку уже выполнил сам обработчик, и повтор упирается в уникальный ключ:
+        # план без выполнения всё равно проверяем, буферов у него нет
+        conn.rollback()
+        for statement in setup:
+            cur.execute(statement)
+        cur.execute('EXPLAIN (FORMAT JSON) ' + sql)
+        plan = cur.fetchone()[0][0]
+    finally:
+        cur.close()
+        conn.rollback()
+    root = plan['Plan']
+    return {
+        'shape': plan_shape(root),
+        'seq_scans': sorted(seq_scans(root)),
+        'buffers': root.get('Shared Hit Blocks', 0) + root.get('Shared Read Blocks', 0),
+        'execution_ms': round(plan.get('Execution Time', 0.0), 3)
+    }
+
+
+def large_tables(conn, min_rows: int) -> set:
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relkind = 'r' AND n.nspname = 'public' AND c.reltuples >= %s
+    """, (min_rows,))
+    tables = {row[0] for row in cur.fetchall()}
+    cur.close()
+    conn.rollback()
+    return tables
+
+
+def check_plans(plans: dict, snapshots: dict, large: set, allowed: dict, threshold: float, min_blocks: int) -> tuple:
+    failures = []
+    warnings = []
+    for key, plan in sorted(plans.items()):
+        if 'error' in plan:
+            failures.append(f"{key}: EXPLAIN failed: {plan['error']}")
+            continue
+        route = key.rsplit(' ', 1)[0]
+        bad_scans = (set(plan['seq_scans']) & large) - set(allowed.get(route, []))
+        if bad_scans:
+            failures.append(f"{key}: Seq Scan on {', '.join(sorted(bad_scans))}")
+        previous = snapshots.get(key)
+        if not previous:
+            continue
+        if plan['buffers'] > previous['buffers'] * (1 + threshold) and plan['buffers'] - previous['buffers'] >= min_blocks:
+            failures.append(f"{key}: buffers {previous['buffers']} -> {plan['buffers']}")
+        if plan['shape'] != previous['shape']:
+            warnings.append(f"{key}: plan changed {' > '.join(previous['shape'])} => {' > '.join(plan['shape'])}")
+    return failures, warnings
+
+
+def route_totals(plans: dict) -> dict:
+    totals = {}
+    for key, plan in plans.items():
+        if 'error' in plan:
+            continue
+        route = totals.setdefault(key.rsplit(' ', 1)[0], {'execution_ms': 0.0, 'buffers': 0})
+        route['execution_ms'] += plan['execution_ms']
+        route['buffers'] += plan['buffers']
+    return totals
+
+
+def compare_totals(before: dict, after: dict) -> dict:
+    totals = {}
+    before_totals = route_totals(before)
+    for route, now in route_totals(after).items():
+        was = before_totals.get(route)
+        if not was:
+            continue
+        totals[route] = {
+            'before': {'execution_ms': round(was['execution_ms'], 3), 'buffers': was['buffers']},
+            'after': {'execution_ms': round(now['execution_ms'], 3), 'buffers': now['buffers']}
+        }
+    return totals
+
+
+def compare_reports(before: dict, after: dict) -> list:
+    lines = []
+    for route, totals in sorted(compare_totals(before, after).items()):
+        was, now = totals['before'], totals['after']
+        lines.append(f"{route:40} {was['execution_ms']:9.3f} -> {now['execution_ms']:9.3f} ms  "
+                     f"buffers {was['buffers']} -> {now['buffers']}")
+    return lines
+
+
+def server_version(conn) -> str:
+    cur = conn.cursor()
+    cur.execute("SELECT current_setting('server_version'), (SELECT extversion FROM pg_extension WHERE extname = 'pg_trgm')")
+    version, trgm = cur.fetchone()
+    cur.close()
+    conn.rollback()
+    return f'PostgreSQL {version}, pg_trgm {trgm}' if trgm else f'PostgreSQL {version}'
+
+
+def major_version(server: str) -> str:
+    return re.match(r'PostgreSQL (\d+)', server).group(1)
+
+
+def record_benchmark(label: str, before: dict, after: dict, preset: str, seed: int, server: str) -> None:
+    benchmarks = {}
+    if os.path.exists(BENCHMARKS_PATH):
+        with open(BENCHMARKS_PATH, encoding='utf-8') as f:
+            benchmarks = json.load(f)
+    benchmarks[label] = {'preset': preset, 'seed': seed, 'server': server,
+                         'before': {'upto': before.get('upto'), 'skip': before.get('skip', [])},
+                         'routes': compare_totals(before['plans'], after)}
+    with open(BENCHMARKS_PATH, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(benchmarks, indent=2, sort_keys=True, ensure_ascii=False) + '\n')
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='EXPLAIN every handler query against synthetic data')
+    parser.add_argument('functions', nargs='*', help='function directories (default: all with tests.json)')
+    parser.add_argument('--preset', choices=sorted(seed_data.PRESETS), default='small')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--admin-url', help='server for the disposable database (default: HARNESS_ADMIN_URL)')
+    parser.add_argument('--large-table-rows', type=int, default=10_000)
+    parser.add_argument('--buffer-threshold', type=float, default=0.5, help='allowed relative growth of buffers')
+    parser.add_argument('--min-blocks', type=int, default=64, help='ignore buffer growth smaller than this')
+    parser.add_argument('--output', help='write the full plan report as JSON')
+    parser.add_argument('--update', action='store_true', help='rewrite tools/plan_snapshots.json')
+    parser.add_argument('--upto', type=int, help='apply migrations only up to this version')
+    parser.add_argument('--skip', type=int, action='append', default=[], help='leave out this migration version')
+    parser.add_argument('--compare', help='earlier --output report to compare per-route totals with')
+    parser.add_argument('--benchmark', metavar='LABEL',
+                        help='store the --compare totals under LABEL in tools/plan_benchmarks.json')
+    args = parser.parse_args(argv)
+    if args.benchmark and not args.compare:
+        parser.error('--benchmark needs a --compare report')
+    partial_schema = args.upto is not None or bool(args.skip)
+    if args.update and partial_schema:
+        parser.error('--update records the full schema and cannot be combined with --upto or --skip')
+
+    functions = args.functions or handler_harness.list_functions()
+    scenarios = load_scenarios()
+
+    with disposable_database(args.admin_url, upto=args.upto, skip=tuple(args.skip)) as database_url:
+        seed_data.generate(database_url, args.preset, args.seed, log=lambda message: print(message, file=sys.stderr))
+        env = {'DATABASE_URL': database_url, 'JWT_SECRET': handler_harness.HARNESS_JWT_SECRET,
+               'SWEEPER_SECRET': handler_harness.HARNESS_SWEEPER_SECRET, 'STARTUP_REPORT': '0', 'REQUEST_LOG': '0'}
+        token = handler_harness.owner_token(database_url)
+        statements, failed_cases = capture_statements(functions, env, token, scenarios)
+
+        conn = psycopg2.connect(database_url)
+        server = server_version(conn)
+        large = large_tables(conn, args.large_table_rows)
+        plans = {}
+        temp_tables = {}
+        for route, template, sql in statements:
+            if TEMP_SETUP.match(template) and sql not in temp_tables.get(route, ()):
+                temp_tables.setdefault(route, []).append(sql)
+            key = f'{route} {fingerprint(template)}'
+            if key in plans or SKIPPED_STATEMENTS.match(template):
+                continue
+            try:
+                plans[key] = {'sql': ' '.join(template.split()), **explain(conn, sql, tuple(temp_tables.get(route, ())))}
+            except psycopg2.Error as e:
+                conn.rollback()
+                plans[key] = {'sql': ' '.join(template.split()), 'error': str(e).strip()}
+        conn.close()
+
+    # Снимок снят с полной схемой, с --upto и --skip сравнивать с ним нечего
+    snapshots = {}
+    skipped_snapshot = None
+    if os.path.exists(SNAPSHOTS_PATH) and not args.update and not partial_schema:
+        with open(SNAPSHOTS_PATH, encoding='utf-8') as f:
+            recorded = json.load(f)
+        if major_version(recorded['server']) == major_version(server):
+            snapshots = recorded['plans']
+        else:
+            skipped_snapshot = f"snapshot recorded on {recorded['server']}, this is {server}: not compared"
+    failures, warnings = check_plans(plans, snapshots, large, scenarios.get('allow_seq_scan', {}),
+                                     args.buffer_threshold, args.min_blocks)
+    if skipped_snapshot:
+        warnings.append(skipped_snapshot)
+    # Упавший обработчик не доходит до части запросов, и их планы не проверены
+    failures = failed_cases + failures
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'preset': args.preset, 'seed': args.seed, 'server': server,
+                                'upto': args.upto, 'skip': args.skip,
+                                'large_tables': sorted(large), 'plans': plans, 'failures': failures, 'warnings': warnings},
+                               indent=2, sort_keys=True, ensure_ascii=False) + '\n')
+    if args.update:
+        snapshot = {'server': server,
+                    'plans': {key: {'shape': plan['shape'], 'buffers': plan['buffers']}
+                              for key, plan in plans.items() if 'error' not in plan}}
+        with open(SNAPSHOTS_PATH, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(snapshot, indent=2, sort_keys=True, ensure_ascii=False) + '\n')
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            before = json.load(f)
+        for line in compare_reports(before['plans'], plans):
+            print(line)
+        if args.benchmark:
+            record_benchmark(args.benchmark, before, plans, args.preset, args.seed, server)
+    for warning in warnings:
+        print(f'warn {warning}')
+    for failure in failures:
+        print(f'FAIL {failure}')
+    print(f'{len(plans)} statements checked, {len(failures)} failures, {len(warnings)} warnings')
+    return 1 if failures and not args.update else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,445 @@
+"""Детерминированный генератор синтетических данных для нагрузочных замеров
+
+Строки генерируются потоком и заливаются через COPY, поэтому память не растёт
+с объёмом. Одинаковые --seed и --preset дают одинаковые данные. Распределения
+подобраны под то, что видно в живом сообществе: членство во фракциях, авторы
+постов, комментарии и лайки, цели модерации — всё по Zipf, с парой очень
+крупных фракций и тредов и длинным хвостом мелких.
+
+    python tools/seed_data.py --database-url postgresql://localhost/loadtest --preset small --seed 42
+    python tools/seed_data.py --preset tiny --disposable --keep-db
+
+База назначения задаётся только явным --database-url (DATABASE_URL не читается),
+и загрузка отказывается идти в базу, где уже есть посты, комментарии, лайки или
+журнал, а также на удалённый хост без --allow-remote.
+"""
+import argparse
+import bisect
+import functools
+import hashlib
+import itertools
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import psycopg2
+import psycopg2.extensions
+
+PRESETS = {
+    'tiny': {
+        'users': 2_000, 'factions': 20, 'posts': 5_000, 'comments': 15_000,
+        'likes': 20_000, 'admin_logs': 20_000, 'admins': 10, 'sanctions': 50
+    },
+    'small': {
+        'users': 50_000, 'factions': 60, 'posts': 100_000, 'comments': 300_000,
+        'likes': 400_000, 'admin_logs': 500_000, 'admins': 25, 'sanctions': 1_000
+    },
+    'community': {
+        'users': 1_000_000, 'factions': 200, 'posts': 2_000_000, 'comments': 6_000_000,
+        'likes': 8_000_000, 'admin_logs': 10_000_000, 'admins': 60, 'sanctions': 20_000
+    }
+}
+
+ZIPF_EXPONENT = 1.1
+MEMBERSHIP_RATE = 0.6
+TIMELINE_START = datetime(2023, 1, 1)
+TIMELINE_END = datetime(2025, 10, 1)
+# Комментарии идут в среднем раз в COMMENT_GAP, но крупный тред укладывается в THREAD_WINDOW
+COMMENT_GAP = timedelta(minutes=90)
+THREAD_WINDOW = timedelta(days=30)
+LOCAL_HOSTS = ('', 'localhost', '127.0.0.1', '::1')
+SEEDED_TABLES = ('forum_posts', 'forum_comments', 'post_likes', 'admin_logs')
+# Первые BULK_TARGETS пользователей получают предсказуемые имена bulk_target_0000..0999:
+# по ним сценарий массовой модерации в plan_scenarios.json адресует 1000 реальных целей
+BULK_TARGETS = 1_000
+# Все синтетические пользователи входят с этим паролем (хэш — sha256, как в auth)
+PASSWORD = 'synthetic_password'
+PASSWORD_HASH = hashlib.sha256(PASSWORD.encode()).hexdigest()
+
+CATEGORIES = ('general', 'news', 'factions', 'guides', 'offtopic', 'complaints', 'appeals')
+FACTION_TYPES = ('open', 'closed', 'criminal')
+RANKS = ('Рядовой', 'Сержант', 'Лейтенант', 'Капитан', 'Майор', 'Полковник')
+ADMIN_RANKS = ('Младший администратор', 'Администратор', 'Старший администратор')
+
+# Тип записи журнала -> вес
+LOG_ACTIONS = {
+    'MUTE': 30, 'UNMUTE': 12, 'BAN': 18, 'UNBAN': 6, 'ASSIGN_FACTION': 25,
+    'MUTE_EXPIRED': 5, 'BAN_EXPIRED': 3, 'ADMIN_APPOINTED': 1
+}
+
+SYLLABLES = ('ka', 'ro', 'mi', 'zen', 'tor', 'vel', 'sha', 'dim', 'lex', 'nor', 'ga', 'pri', 'vo', 'ste', 'ul', 'bra')
+WORDS = (
+    'сервер', 'фракция', 'патруль', 'машина', 'генерал', 'жалоба', 'правила', 'ивент', 'город', 'отряд',
+    'операция', 'задержание', 'маршрут', 'база', 'форма', 'набор', 'отчёт', 'собрание', 'тренировка', 'модерация',
+    'server', 'update', 'patrol', 'convoy', 'vehicle', 'recruitment', 'event', 'guide', 'map', 'rules',
+    'бан', 'мут', 'апелляция', 'рейд', 'склад', 'погоня', 'конвой', 'вертолёт', 'пост', 'смена'
+)
+
+
+@functools.lru_cache(maxsize=None)
+def zipf_cumulative(n: int, s: float = ZIPF_EXPONENT) -> list:
+    return list(itertools.accumulate(1.0 / (k ** s) for k in range(1, n + 1)))
+
+
+def zipf_picker(rng: random.Random, items: list, s: float = ZIPF_EXPONENT):
+    # Ранги перемешиваются, чтобы «тяжёлые» элементы не совпадали с первыми id
+    order = list(items)
+    rng.shuffle(order)
+    cumulative = zipf_cumulative(len(order), s)
+    total = cumulative[-1]
+    last = len(order) - 1
+
+    def pick():
+        return order[min(bisect.bisect_left(cumulative, rng.random() * total), last)]
+    return pick
+
+
+def zipf_counts(rng: random.Random, n: int, total: int, s: float = ZIPF_EXPONENT) -> list:
+    cumulative = zipf_cumulative(n, s)
+    scale = total / cumulative[-1]
+    previous = 0.0
+    counts = []
+    for value in cumulative:
+        counts.append(int((value - previous) * scale + rng.random()))
+        previous = value
+    rng.shuffle(counts)
+    return counts
+
+
+def copy_value(value) -> str:
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    text = str(value)
+    if any(char in text for char in '\\\t\n\r'):
+        text = text.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+    return text
+
+
+class RowStream:
+    """Файлоподобный источник для copy_expert поверх генератора строк"""
+
+    def __init__(self, rows):
+        self._lines = ('\t'.join(copy_value(value) for value in row) + '\n' for row in rows)
+        self._buffer = ''
+        self.rows = 0
+
+    def read(self, size: int = -1) -> str:
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        while size < 0 or length < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            chunks.append(line)
+            length += len(line)
+            self.rows += 1
+        data = ''.join(chunks)
+        if size < 0 or len(data) <= size:
+            self._buffer = ''
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+    def readline(self, size: int = -1) -> str:
+        return self.read(size)
+
+
+def copy_rows(cur, table: str, columns: tuple, rows) -> int:
+    stream = RowStream(rows)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", stream, size=1 << 16)
+    return stream.rows
+
+
+def timeline(index: int, total: int) -> datetime:
+    # Время создания выводится из порядкового номера, а не хранится: id растут вместе со временем
+    span = (TIMELINE_END - TIMELINE_START).total_seconds()
+    return TIMELINE_START + timedelta(seconds=span * index / max(total, 1))
+
+
+def make_sentences(rng: random.Random, count: int = 4000) -> list:
+    sentences = []
+    for _ in range(count):
+        words = rng.choices(WORDS, k=rng.randint(5, 16))
+        sentences.append(' '.join(words).capitalize() + rng.choice(('.', '.', '!', '?')))
+    return sentences
+
+
+def make_username(rng: random.Random, user_id: int) -> str:
+    return ''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) + str(user_id)
+
+
+def next_id(cur, table: str) -> int:
+    cur.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}")
+    return cur.fetchone()[0]
+
+
+def sync_sequence(cur, table: str) -> None:
+    cur.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1)) FROM {table}")
+
+
+def generate(database_url: str, preset: str, seed: int = 42, log=print) -> dict:
+    sizes = PRESETS[preset]
+    rng = random.Random(seed)
+    sentences = make_sentences(rng)
+    loaded = {}
+
+    conn = psycopg2.connect(database_url)
+    cur = conn.cursor()
+    cur.execute("SET synchronous_commit = off")
+
+    def step(table: str, count: int, started: float) -> None:
+        conn.commit()
+        loaded[table] = loaded.get(table, 0) + count
+        log(f'{table}: {count} rows in {time.monotonic() - started:.1f}s')
+
+    # Пользователи
+    started = time.monotonic()
+    first_user = next_id(cur, 'users')
+    user_ids = list(range(first_user, first_user + sizes['users']))
+
+    def user_created(user_id: int) -> datetime:
+        return timeline(user_id - first_user, len(user_ids))
+
+    def user_rows():
+        for user_id in user_ids:
+            created = user_created(user_id)
+            username = make_username(rng, user_id)
+            if user_id - first_user < BULK_TARGETS:
+                username = f'bulk_target_{user_id - first_user:04d}'
+            yield (
+                user_id, f'synthetic_{user_id}', username, username, PASSWORD_HASH,
+                ' '.join(rng.choices(WORDS, k=2)).title(), rng.choice(sentences) if rng.random() < 0.3 else None,
+                created, created
+            )
+
+    count = copy_rows(cur, 'users', (
+        'id', 'discord_id', 'discord_username', 'username', 'password_hash',
+        'nickname', 'bio', 'created_at', 'updated_at'
+    ), user_rows())
+    sync_sequence(cur, 'users')
+    step('users', count, started)
+
+    # Фракции и членство
+    started = time.monotonic()
+    cur.execute("SELECT COUNT(*) FROM factions")
+    existing_factions = cur.fetchone()[0]
+    first_faction = next_id(cur, 'factions')
+    new_factions = max(sizes['factions'] - existing_factions, 0)
+    count = copy_rows(cur, 'factions', ('id', 'name', 'type', 'description', 'color', 'is_open'), (
+        (
+            first_faction + index, f'Фракция {first_faction + index}', FACTION_TYPES[index % 3],
+            rng.choice(sentences), '#%06x' % rng.randrange(1 << 24), index % 3 != 1
+        )
+        for index in range(new_factions)
+    ))
+    sync_sequence(cur, 'factions')
+    step('factions', count, started)
+
+    started = time.monotonic()
+    cur.execute("SELECT id FROM factions ORDER BY id")
+    faction_ids = [row[0] for row in cur.fetchall()]
+    cur.execute("SELECT DISTINCT faction_id FROM faction_members WHERE is_general")
+    has_general = {row[0] for row in cur.fetchall()}
+    pick_faction = zipf_picker(rng, faction_ids)
+
+    def member_rows():
+        for user_id in user_ids:
+            if rng.random() >= MEMBERSHIP_RATE:
+                continue
+            faction_id = pick_faction()
+            is_general = faction_id not in has_general
+            has_general.add(faction_id)
+            yield (
+                user_id, faction_id, 'Генерал' if is_general else rng.choice(RANKS), is_general,
+                user_created(user_id) + timedelta(days=rng.random() * 30)
+            )
+
+    count = copy_rows(cur, 'faction_members', ('user_id', 'faction_id', 'rank', 'is_general', 'joined_at'), member_rows())
+    step('faction_members', count, started)
+
+    # Администраторы и санкции
+    started = time.monotonic()
+    cur.execute("SELECT id FROM custom_roles WHERE is_admin_role ORDER BY id")
+    admin_roles = [row[0] for row in cur.fetchall()] or [None]
+    admin_user_ids = rng.sample(user_ids, min(sizes['admins'], len(user_ids)))
+    count = copy_rows(cur, 'admins', (
+        'discord_id', 'user_id', 'admin_rank', 'role_id', 'appointed_by', 'appointed_at', 'is_active'
+    ), (
+        (f'synthetic_admin_{user_id}', user_id, rng.choice(ADMIN_RANKS), rng.choice(admin_roles),
+         'seed', user_created(user_id) + timedelta(days=30), True)
+        for user_id in admin_user_ids
+    ))
+    step('admins', count, started)
+
+    pick_target = zipf_picker(rng, user_ids)
+    pick_admin = zipf_picker(rng, admin_user_ids)
+
+    def sanction_rows(kind: str):
+        for index in range(sizes['sanctions'] // 2):
+            user_id = pick_target()
+            admin_id = pick_admin()
+            issued = timeline(index, sizes['sanctions'] // 2)
+            duration = rng.choice((60, 1440, 10080, 43200))
+            expires = issued + timedelta(minutes=duration)
+            # Часть санкций уже истекла, но ещё не снята — работа для sweeper
+            active = expires > TIMELINE_END - timedelta(days=3) or rng.random() < 0.1
+            yield (
+                f'synthetic_{user_id}', f'synthetic_admin_{admin_id}', f'Synthetic {kind}', duration,
+                issued, expires, active, user_id, admin_id, issued
+            )
+
+    started = time.monotonic()
+    count = copy_rows(cur, 'bans', (
+        'user_discord_id', 'banned_by', 'reason', 'duration', 'banned_at', 'expires_at',
+        'is_active', 'user_id', 'banned_by_id', 'updated_at'
+    ), sanction_rows('ban'))
+    step('bans', count, started)
+
+    started = time.monotonic()
+    count = copy_rows(cur, 'mutes', (
+        'user_discord_id', 'muted_by', 'reason', 'duration', 'muted_at', 'expires_at',
+        'is_active', 'user_id', 'muted_by_id', 'updated_at'
+    ), sanction_rows('mute'))
+    step('mutes', count, started)
+
+    # Посты, комментарии и лайки
+    started = time.monotonic()
+    first_post = next_id(cur, 'forum_posts')
+    post_count = sizes['posts']
+    comment_counts = zipf_counts(rng, post_count, sizes['comments'])
+    like_counts = [min(likes, len(user_ids)) for likes in zipf_counts(rng, post_count, sizes['likes'])]
+    pick_author = zipf_picker(rng, user_ids)
+
+    def post_rows():
+        for index in range(post_count):
+            created = timeline(index, post_count)
+            yield (
+                first_post + index, pick_author(), ' '.join(rng.choices(WORDS, k=rng.randint(3, 9))).capitalize(),
+                ' '.join(rng.choices(sentences, k=rng.randint(2, 20))), rng.choice(CATEGORIES),
+                int(rng.lognormvariate(4, 1.2)) + like_counts[index], like_counts[index], comment_counts[index],
+                created, created
+            )
+
+    count = copy_rows(cur, 'forum_posts', (
+        'id', 'user_id', 'title', 'content', 'category', 'views', 'likes', 'comments_count',
+        'created_at', 'updated_at'
+    ), post_rows())
+    sync_sequence(cur, 'forum_posts')
+    step('forum_posts', count, started)
+
+    started = time.monotonic()
+    pick_commenter = zipf_picker(rng, user_ids)
+
+    def comment_rows():
+        for index, comments in enumerate(comment_counts):
+            created = timeline(index, post_count)
+            thread_end = created + THREAD_WINDOW
+            gap = min(COMMENT_GAP, THREAD_WINDOW / (comments + 1))
+            for _ in range(comments):
+                created = min(created + gap * rng.expovariate(1), thread_end)
+                yield (
+                    first_post + index, pick_commenter(),
+                    ' '.join(rng.choices(sentences, k=rng.randint(1, 3))), created
+                )
+
+    count = copy_rows(cur, 'forum_comments', ('post_id', 'user_id', 'content', 'created_at'), comment_rows())
+    step('forum_comments', count, started)
+
+    started = time.monotonic()
+
+    def like_rows():
+        for index, likes in enumerate(like_counts):
+            created = timeline(index, post_count)
+            for user_offset in rng.sample(range(len(user_ids)), likes):
+                yield first_post + index, user_ids[user_offset], created + timedelta(hours=rng.random() * 72)
+
+    count = copy_rows(cur, 'post_likes', ('post_id', 'user_id', 'created_at'), like_rows())
+    step('post_likes', count, started)
+
+    # Журнал действий администраторов
+    started = time.monotonic()
+    actions = list(LOG_ACTIONS)
+    action_weights = list(itertools.accumulate(LOG_ACTIONS.values()))
+
+    def log_rows():
+        total = sizes['admin_logs']
+        for index in range(total):
+            action = rng.choices(actions, cum_weights=action_weights)[0]
+            admin_id = None if action.endswith('_EXPIRED') else pick_admin()
+            target_id = pick_target()
+            yield (
+                f'synthetic_admin_{admin_id}' if admin_id else 'system', admin_id, action, target_id,
+                f'synthetic_{target_id}', f'{action.lower()} #{index}', timeline(index, total)
+            )
+
+    count = copy_rows(cur, 'admin_logs', (
+        'admin_discord_id', 'admin_id', 'action_type', 'target_user_id', 'target_discord_id',
+        'details', 'created_at'
+    ), log_rows())
+    step('admin_logs', count, started)
+
+    for table in ('forum_comments', 'admins', 'bans', 'mutes', 'admin_logs', 'faction_members'):
+        sync_sequence(cur, table)
+    conn.commit()
+
+    # VACUUM сливает pending list GIN-индексов и заполняет карту видимости: без него
+    # буферы поиска и index-only scan зависят от того, успел ли пройти autovacuum
+    conn.autocommit = True
+    cur.execute("VACUUM ANALYZE")
+    cur.close()
+    conn.close()
+    return loaded
+
+
+def check_target(database_url: str, allow_remote: bool) -> str:
+    host = psycopg2.extensions.parse_dsn(database_url).get('host', '')
+    if not allow_remote and host not in LOCAL_HOSTS and not host.startswith('/'):
+        return f'{host} is not a local host; pass --allow-remote to load into it anyway'
+    conn = psycopg2.connect(database_url)
+    cur = conn.cursor()
+    cur.execute(' UNION ALL '.join(f"SELECT '{table}' FROM (SELECT 1 FROM {table} LIMIT 1) t"
+                                   for table in SEEDED_TABLES))
+    filled = [row[0] for row in cur.fetchall()]
+    cur.close()
+    conn.close()
+    if filled:
+        return f"database already has rows in {', '.join(filled)}; load into an empty one (or use --disposable)"
+    return None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Bulk-load a deterministic synthetic dataset')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='tiny')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database-url', help='target database; DATABASE_URL is deliberately not used')
+    parser.add_argument('--allow-remote', action='store_true', help='allow a --database-url on a non-local host')
+    parser.add_argument('--disposable', action='store_true',
+                        help='create a fresh database from db_migrations/ (see localdb.py) and load into it')
+    parser.add_argument('--keep-db', action='store_true', help='keep the disposable database and print its URL')
+    parser.add_argument('--admin-url', help='server for --disposable (default: HARNESS_ADMIN_URL)')
+    args = parser.parse_args(argv)
+
+    if args.disposable:
+        from localdb import disposable_database
+        with disposable_database(args.admin_url, keep=args.keep_db) as database_url:
+            generate(database_url, args.preset, args.seed)
+            if args.keep_db:
+                print(database_url)
+        return 0
+
+    if not args.database_url:
+        parser.error('--database-url or --disposable is required')
+    problem = check_target(args.database_url, args.allow_remote)
+    if problem:
+        parser.error(problem)
+    generate(args.database_url, args.preset, args.seed)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""Раскладка общего ядра backend/_shared/core.py по папкам функций
+
+Платформа деплоит каждую папку backend/<функция> отдельно, поэтому ядро не
+импортируется из общего места, а копируется в неё как core.py. Правится только
+backend/_shared/core.py; после правки:
+
+    python tools/sync_shared.py            # обновить копии
+    python tools/sync_shared.py --check    # код 1, если какая-то копия разошлась
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT, 'backend')
+SHARED_DIR = os.path.join(BACKEND_DIR, '_shared')
+
+# Функции, которые импортируют ядро; sweeper работает с psycopg2 напрямую
+FUNCTIONS = ('admin', 'api', 'auth', 'forum')
+MODULES = ('core.py',)
+
+COPY_HEADER = '# Копия backend/_shared/{name}, создана tools/sync_shared.py. Не редактировать вручную.\n'
+
+
+def expected_copy(name: str) -> str:
+    with open(os.path.join(SHARED_DIR, name), encoding='utf-8') as f:
+        return COPY_HEADER.format(name=name) + f.read()
+
+
+def current_copy(path: str):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Copy backend/_shared modules into every function directory')
+    parser.add_argument('--check', action='store_true', help='only report copies that differ from the source')
+    args = parser.parse_args(argv)
+
+    stale = []
+    for name in MODULES:
+        content = expected_copy(name)
+        for function in FUNCTIONS:
+            path = os.path.join(BACKEND_DIR, function, name)
+            if current_copy(path) == content:
+                continue
+            stale.append(os.path.relpath(path, ROOT))
+            if not args.check:
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(content)
+
+    for path in stale:
+        print(f"{'stale' if args.check else 'updated'} {path}")
+    return 1 if stale and args.check else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())